@@ -0,0 +1,89 @@
+import time
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+from micropython import const
+import core
+
+# Status effects drawn while the strips have no forecast to show:
+# (style, colour, brightness, frames each step is held for)
+EFFECTS = {
+    'connecting': ('chase', 'cyan', 5, 1),
+    'fetching':   ('pulse', 'blue', 4, 2),
+    'error':      ('blink', 'red', 5, 12),
+}
+EFFECT_TAIL = const(4)
+EFFECT_LEVELS = const(8)
+def get_pixel(color, brightness):
+    # One pixel in the strip's wire order, ready to copy into a strip buffer
+    pixel = bytearray(3)
+    rgb = core.get_color(color, brightness)
+    for channel in range(3):
+        pixel[core.NeoPixel.ORDER[channel]] = round(rgb[channel])
+    return pixel
+
+class Animator():
+    # Plays a status effect on every panel as a task beside the network work. Frames are built
+    # once per effect and strip length, so a tick is a buffer copy and one write per panel, and
+    # ticks keep to a fixed ANIMATION_FRAME_MS budget, skipping frames rather than drifting.
+    def __init__(self):
+        self.frame_ms = core.CONFIG['LED'].get('ANIMATION_FRAME_MS', 40)
+        self.frames = {}
+        self.effect = None
+        self.task = None
+        self.started = 0
+    def get_frames(self, effect, count):
+        key = effect + str(count)
+        frames = self.frames.get(key)
+        if frames is None:
+            style, color, brightness, hold = EFFECTS[effect]
+            if style == 'chase':
+                # Twice the strip length with the head in the middle; the window starting
+                # `step` pixels before the middle puts the head on pixel `step`
+                track = bytearray(count * 6)
+                for tail in range(min(EFFECT_TAIL, count)):
+                    start = (count - tail) * 3
+                    track[start:start + 3] = get_pixel(color, brightness * (EFFECT_TAIL - tail) / EFFECT_TAIL)
+                frames = (style, memoryview(track), hold)
+            else:
+                if style == 'pulse':
+                    levels = [bytearray(get_pixel(color, brightness * (level + 1) / EFFECT_LEVELS)) * count for level in range(EFFECT_LEVELS)]
+                    steps = levels + levels[-2:0:-1]
+                else:
+                    steps = [bytearray(get_pixel(color, brightness)) * count, bytearray(count * 3)]
+                frames = (style, steps, hold)
+            self.frames[key] = frames
+        return frames
+    def draw(self, frame):
+        for panel in core.PANELS:
+            count = len(panel.strip)
+            style, steps, hold = self.get_frames(self.effect, count)
+            step = frame // hold
+            if style == 'chase':
+                start = (count - step % count) * 3
+                panel.strip.buf[:] = steps[start:start + count * 3]
+            else:
+                panel.strip.buf[:] = steps[step % len(steps)]
+            core.write_strip(panel.strip)
+    async def run(self):
+        while True:
+            self.draw(time.ticks_diff(time.ticks_ms(), self.started) // self.frame_ms)
+            await asyncio.sleep_ms(self.frame_ms - time.ticks_diff(time.ticks_ms(), self.started) % self.frame_ms)
+    def start(self, effect):
+        # Must be called from inside the running event loop
+        self.play(effect)
+        self.task = asyncio.create_task(self.run())
+    def play(self, effect):
+        if effect != self.effect:
+            self.effect = effect
+            self.started = time.ticks_ms()
+    def stop(self):
+        # Leaves the first frame of the current effect on the strips
+        if self.task is None:
+            return
+        self.task.cancel()
+        self.task = None
+        self.draw(0)
+        self.frames = {}
+        self.effect = None
@@ -0,0 +1,75 @@
+# This file is executed on every boot (including wake-boot from deepsleep)
+import os
+import json
+
+VERSION_TRACKER_FILE = 'version.txt'
+UPDATE_MARKER_FILE = 'update_pending.json'
+MAX_BOOT_ATTEMPTS = 2
+
+def firmware_compiles(files):
+    for path in files:
+        if not path.endswith('.py'):
+            continue
+        try:
+            with open(path, 'r') as f:
+                compile(f.read(), path, 'exec')
+        except SyntaxError as e:
+            print(f'  >> {path} does not compile. Error: {e}')
+            return False
+        except (MemoryError, NameError):
+            # Not enough heap for a second copy of the source, or no compile() on this port
+            return True
+    return True
+
+def roll_back(marker):
+    print(f'Rolling back to version {marker["previous"]}')
+    for path in marker['files']:
+        backup = path + '.bak'
+        if backup in os.listdir():
+            if path in os.listdir():
+                os.remove(path)
+            os.rename(backup, path)
+    with open(VERSION_TRACKER_FILE, 'w') as f:
+        f.write(marker['previous'])
+    os.remove(UPDATE_MARKER_FILE)
+
+def read_marker():
+    # A marker cut short by a power loss cannot say what to roll back to, so it is dropped and the
+    # files on flash are kept
+    try:
+        with open(UPDATE_MARKER_FILE, 'r') as f:
+            marker = json.load(f)
+        marker['version'], marker['previous'], marker['files'], marker['attempts']
+        return marker
+    except Exception as e:
+        print(f'  >> Update marker is unreadable, removing it. Error: {e}')
+        os.remove(UPDATE_MARKER_FILE)
+        return None
+
+def write_marker(marker):
+    with open(UPDATE_MARKER_FILE + '.new', 'w') as f:
+        f.write(json.dumps(marker))
+    os.remove(UPDATE_MARKER_FILE)
+    os.rename(UPDATE_MARKER_FILE + '.new', UPDATE_MARKER_FILE)
+
+def check_pending_update():
+    if UPDATE_MARKER_FILE not in os.listdir():
+        return
+    marker = read_marker()
+    if marker is None:
+        return
+    marker['attempts'] = marker['attempts'] + 1
+    print(f'Update to {marker["version"]} is pending, boot attempt {marker["attempts"]}/{MAX_BOOT_ATTEMPTS}')
+    missing = [path for path in marker['files'] if path not in os.listdir()]
+    if missing:
+        print(f'  >> Update was interrupted, missing {missing}')
+        roll_back(marker)
+    elif marker['attempts'] > MAX_BOOT_ATTEMPTS:
+        print('  >> New version never reached main_loop')
+        roll_back(marker)
+    elif marker['attempts'] == 1 and not firmware_compiles(marker['files']):
+        roll_back(marker)
+    else:
+        write_marker(marker)
+
+check_pending_update()
@@ -0,0 +1,1784 @@
+import ntptime
+import time
+import network
+import machine
+import os
+import json
+import binascii
+import struct
+import gc
+import random
+import sys
+from array import array
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+from neopixel import NeoPixel
+from micropython import const
+
+REPO = 'jhaugh0/Rain-Chance-Monitor'
+CONFIG_FILE = "config.json"
+VERSION_TRACKER_FILE = 'version.txt'
+VERSION_ETAG_FILE = 'version_etag.txt'
+UPDATE_MARKER_FILE = 'update_pending.json'
+RUN_LOG = 'run.log'
+ERROR_LOG = 'error.log'
+LOCATION_CACHE_FILE = 'location_cache.json'
+FORECAST_STORE_FILE = 'forecast.bin'
+FORECAST_MAGIC = b'RCMS'
+FORECAST_HEADER = '<4sBBxxiII'
+FORECAST_HOURS = const(72)
+FORECAST_MISSING = const(-128)
+FORECAST_METRICS = ('rain', 'temp', 'feels')
+FORECAST_TYPECODES = {'rain': 'b', 'temp': 'h', 'feels': 'h'}
+METRIC_GRADIENTS = {'rain': 'greenRed', 'temp': 'blueRed', 'feels': 'blueRed'}
+NO_SLOT = const(255)
+SLEEP_STATE_FILE = 'sleep_state.json'
+DRIFT_FILE = 'clock_drift.json'
+# A sample further off than this means the RTC lost its time rather than drifted
+MAX_CLOCK_DRIFT = 0.1
+WIFI_CACHE_FILE = 'wifi_cache.json'
+HEALTH_FILE = 'endpoint_health.json'
+FRAME_FILE = 'frame.bin'
+FRAME_MAGIC = b'RCMF'
+FRAME_HEADER = '<4sBBBxiII'
+FRAME_NO_DATA = const(255)
+GATEWAY_ETAG_FILE = 'gateway_etag.txt'
+GATEWAY_MAGIC = b'RCMG'
+GATEWAY_HEADER = '<4sBBBBiII'
+METRICS_FILE = 'metrics.bin'
+METRICS_MAGIC = b'RCMJ'
+METRICS_HEADER = '<4sBBHHHI'
+METRICS_RECORD = '<IIBBBBIIII'
+METRICS_PHASES = ('cycle', 'wifi', 'internet', 'ntp', 'time', 'update', 'fetch', 'parse', 'leds')
+STREAM_CHUNK_BYTES = 512
+JSON_BUFFER_BYTES = 16384
+INVALIDATING_STATUS = (301, 404)
+LOG_DEBUG = const(10)
+LOG_INFO = const(20)
+LOG_ERROR = const(40)
+LOG_LEVELS = {'debug': LOG_DEBUG, 'info': LOG_INFO, 'error': LOG_ERROR}
+# Per-pin and per-poll debug lines sit behind this constant so the compiler drops them entirely.
+# Set it to 1 (and LOG.LEVEL to "debug") when those lines are needed.
+DEBUG_LOGGING = const(0)
+
+print('Getting config from local file')
+with open(CONFIG_FILE, 'r') as f:
+    CONFIG = json.load(f)
+print('  >> Loaded!')
+
+LOG_CONFIG = CONFIG.get('LOG', {})
+LOG_LEVEL = LOG_LEVELS[LOG_CONFIG.get('LEVEL', 'info')]
+LOG_CONSOLE = LOG_CONFIG.get('CONSOLE', True)
+LOG_MAX_FILE_BYTES = LOG_CONFIG.get('MAX_FILE_BYTES', 16384)
+POWER_CONFIG = CONFIG.get('POWER', {})
+
+def get_panel_configs(led):
+    # LED.PANELS lists every strip or matrix: GPIO_PIN, METRIC (rain, temp or feels) and optionally
+    # NAME, GRADIENT and HOURS. A strip takes PIXELS_PER_HOUR and REVERSED; a matrix takes WIDTH,
+    # HEIGHT, WIRING ('rows' or 'columns'), SERPENTINE and REVERSED, with hours running along its
+    # width. Configs without PANELS describe a rain strip and an optional temp strip.
+    panels = led.get('PANELS')
+    if panels:
+        return panels
+    panels = [{'NAME': 'RAIN', 'GPIO_PIN': led['RAIN_GPIO_PIN'], 'METRIC': 'rain', 'HOURS': led['TOTAL_COUNT'], 'REVERSED': led['CABLE_SIDE'] == 'right'}]
+    if led['TEMP_STRIP']:
+        panels.append({'NAME': 'TEMP', 'GPIO_PIN': led['TEMP_GPIO_PIN'], 'METRIC': 'temp', 'HOURS': led['TOTAL_COUNT'], 'REVERSED': led['CABLE_SIDE'] == 'right'})
+    return panels
+
+def get_panel_hours(panel):
+    if 'HOURS' in panel:
+        return panel['HOURS']
+    if 'WIDTH' in panel:
+        return panel['WIDTH']
+    if 'COUNT' in panel:
+        return panel['COUNT'] // panel.get('PIXELS_PER_HOUR', 1)
+    return CONFIG['LED']['TOTAL_COUNT']
+
+def get_display_metrics(panels):
+    metrics = []
+    for panel in panels:
+        if panel['METRIC'] not in metrics:
+            metrics.append(panel['METRIC'])
+    return metrics
+
+PANEL_CONFIGS = get_panel_configs(CONFIG['LED'])
+WINDOW_HOURS = max([get_panel_hours(panel) for panel in PANEL_CONFIGS])
+DISPLAY_METRICS = get_display_metrics(PANEL_CONFIGS)
+
+# Standard UTC offset in minutes and DST rule for each supported LOCATION.TIME_REGION. Regions
+# missing here can set LOCATION.UTC_OFFSET_MINUTES (and optionally LOCATION.DST_RULE) instead,
+# otherwise the local time is looked up from worldtimeapi.
+TIMEZONES = {
+    'UTC':                  (0,    None),
+    'America/New_York':     (-300, 'US'),
+    'America/Detroit':      (-300, 'US'),
+    'America/Toronto':      (-300, 'US'),
+    'America/Chicago':      (-360, 'US'),
+    'America/Winnipeg':     (-360, 'US'),
+    'America/Denver':       (-420, 'US'),
+    'America/Edmonton':     (-420, 'US'),
+    'America/Phoenix':      (-420, None),
+    'America/Los_Angeles':  (-480, 'US'),
+    'America/Vancouver':    (-480, 'US'),
+    'America/Anchorage':    (-540, 'US'),
+    'America/Halifax':      (-240, 'US'),
+    'America/St_Johns':     (-210, 'US'),
+    'America/Puerto_Rico':  (-240, None),
+    'Pacific/Honolulu':     (-600, None),
+    'Europe/London':        (0,    'EU'),
+    'Europe/Dublin':        (0,    'EU'),
+    'Europe/Lisbon':        (0,    'EU'),
+    'Europe/Amsterdam':     (60,   'EU'),
+    'Europe/Berlin':        (60,   'EU'),
+    'Europe/Brussels':      (60,   'EU'),
+    'Europe/Copenhagen':    (60,   'EU'),
+    'Europe/Madrid':        (60,   'EU'),
+    'Europe/Oslo':          (60,   'EU'),
+    'Europe/Paris':         (60,   'EU'),
+    'Europe/Prague':        (60,   'EU'),
+    'Europe/Rome':          (60,   'EU'),
+    'Europe/Stockholm':     (60,   'EU'),
+    'Europe/Vienna':        (60,   'EU'),
+    'Europe/Warsaw':        (60,   'EU'),
+    'Europe/Zurich':        (60,   'EU'),
+    'Europe/Athens':        (120,  'EU'),
+    'Europe/Helsinki':      (120,  'EU'),
+    'Europe/Kyiv':          (120,  'EU'),
+    'Asia/Kolkata':         (330,  None),
+    'Asia/Shanghai':        (480,  None),
+    'Asia/Singapore':       (480,  None),
+    'Asia/Tokyo':           (540,  None),
+    'Australia/Perth':      (480,  None),
+    'Australia/Darwin':     (570,  None),
+    'Australia/Adelaide':   (570,  'AU'),
+    'Australia/Brisbane':   (600,  None),
+    'Australia/Sydney':     (600,  'AU'),
+    'Australia/Melbourne':  (600,  'AU'),
+    'Australia/Hobart':     (600,  'AU'),
+    'Pacific/Auckland':     (720,  'NZ'),
+}
+# DST start and end as (month, nth Sunday with -1 for the last, hour, hour is UTC). Hours that are
+# not UTC are local standard time.
+DST_RULES = {
+    'US': ((3, 2, 2, False), (11, 1, 1, False)),
+    'EU': ((3, -1, 1, True), (10, -1, 1, True)),
+    'AU': ((10, 1, 2, False), (4, 1, 2, False)),
+    'NZ': ((9, -1, 2, False), (4, 1, 2, False)),
+}
+
+RTC = machine.RTC()
+WLAN = network.WLAN(network.STA_IF)
+RTC_SYNCED = False
+UTC_OFFSET = None
+FORECAST_SHOWN = False
+UPDATE_DUE = False
+
+class Ring_log():
+    # Fixed size log buffer. Writes past the end wrap around and overwrite the oldest lines, so a
+    # cycle never allocates more than the message being logged.
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.size = size
+        self.head = 0
+        self.wrapped = False
+    def clear(self):
+        self.head = 0
+        self.wrapped = False
+    def write(self, data):
+        length = len(data)
+        if length > self.size:
+            data = data[length - self.size:]
+            length = self.size
+        end = self.head + length
+        if end <= self.size:
+            self.buffer[self.head:end] = data
+        else:
+            split = self.size - self.head
+            self.buffer[self.head:] = data[:split]
+            self.buffer[:length - split] = data[split:]
+        if end >= self.size:
+            self.wrapped = True
+        self.head = end % self.size
+    def dump(self, f):
+        view = memoryview(self.buffer)
+        if self.wrapped:
+            f.write(view[self.head:])
+        f.write(view[:self.head])
+
+LOG_RING = Ring_log(LOG_CONFIG.get('BUFFER_BYTES', 4096))
+
+class Location_cache():
+    # Provider endpoints and keys resolved from the configured coordinates, kept on flash so they
+    # survive resets and OTA updates. Entries expire after CACHE.LOCATION_TTL_HOURS.
+    def __init__(self):
+        self.entries = None
+        self.ttl = CONFIG.get('CACHE', {}).get('LOCATION_TTL_HOURS', 168) * 60 * 60
+    def load(self):
+        if self.entries is None:
+            self.entries = {}
+            if LOCATION_CACHE_FILE in os.listdir():
+                try:
+                    with open(LOCATION_CACHE_FILE, 'r') as f:
+                        self.entries = json.load(f)
+                except Exception as e:
+                    log(f'  >> Failed to read location cache, starting empty. error: {e}')
+        return self.entries
+    def save(self):
+        with open(LOCATION_CACHE_FILE, 'w') as f:
+            f.write(json.dumps(self.entries))
+    def get_key(self, provider):
+        return provider + ':' + CONFIG['LOCATION']['LATITUDE'] + ',' + CONFIG['LOCATION']['LONGITUDE']
+    def get(self, provider):
+        entry = self.load().get(self.get_key(provider))
+        if entry is None:
+            return None
+        age = time.time() - entry['time']
+        if age < 0 or age > self.ttl:
+            log(f'  >> Cached {provider} location has expired')
+            return None
+        return entry['value']
+    def set(self, provider, value):
+        self.load()[self.get_key(provider)] = {'value': value, 'time': time.time()}
+        self.save()
+    def invalidate(self, provider):
+        if self.load().pop(self.get_key(provider), None) is not None:
+            log(f'  >> Dropping cached {provider} location')
+            self.save()
+
+LOCATION_CACHE = Location_cache()
+
+class Endpoint_health():
+    # Success rate and latency of each provider or host as moving averages, kept on flash. After
+    # HEALTH.FAILURES_TO_OPEN failures in a row the circuit opens and the endpoint is skipped for
+    # HEALTH.COOL_DOWN_MINUTES, then one trial request decides whether it closes again.
+    def __init__(self):
+        health_config = CONFIG.get('HEALTH', {})
+        self.entries = None
+        self.dirty = False
+        self.failures_to_open = health_config.get('FAILURES_TO_OPEN', 3)
+        self.cool_down = health_config.get('COOL_DOWN_MINUTES', 60) * 60
+        self.weight = 0.25
+    def load(self):
+        if self.entries is None:
+            self.entries = {}
+            if HEALTH_FILE in os.listdir():
+                try:
+                    with open(HEALTH_FILE, 'r') as f:
+                        self.entries = json.load(f)
+                except Exception as e:
+                    log(f'  >> Failed to read endpoint health, starting empty. error: {e}')
+        return self.entries
+    def save(self):
+        # Written once per online session rather than after every request, to spare the flash
+        if not self.dirty:
+            return
+        with open(HEALTH_FILE, 'w') as f:
+            f.write(json.dumps(self.entries))
+        self.dirty = False
+    def get(self, name):
+        entry = self.load().get(name)
+        if entry is None:
+            entry = {'rate': 1.0, 'latency': None, 'failures': 0, 'last_failure': None, 'open_until': 0}
+            self.entries[name] = entry
+        return entry
+    def score(self, name):
+        entry = self.get(name)
+        return entry['rate'], -(entry['latency'] or 0)
+    def allow(self, name):
+        entry = self.get(name)
+        remaining = entry['open_until'] - time.time()
+        # A wait longer than the cool-down means the clock moved backwards, so the circuit is closed
+        if remaining <= 0 or remaining > self.cool_down:
+            return True
+        log(f'  >> {name} circuit is open for another {round(remaining/60, 1)} minutes, skipping it')
+        return False
+    def record(self, name, ok, latency_ms=None):
+        entry = self.get(name)
+        entry['rate'] = entry['rate'] + self.weight * ((1 if ok else 0) - entry['rate'])
+        if ok:
+            entry['failures'] = 0
+            entry['open_until'] = 0
+            if latency_ms is not None:
+                if entry['latency'] is None:
+                    entry['latency'] = latency_ms
+                else:
+                    entry['latency'] = round(entry['latency'] + self.weight * (latency_ms - entry['latency']))
+        else:
+            entry['failures'] = entry['failures'] + 1
+            entry['last_failure'] = time.time()
+            if entry['failures'] >= self.failures_to_open:
+                log(f'  >> {name} failed {entry["failures"]} times in a row, opening its circuit for {round(self.cool_down/60)} minutes')
+                entry['open_until'] = time.time() + self.cool_down
+        self.dirty = True
+    def get_backoff(self, attempt, base):
+        # Exponential backoff with jitter: between half and all of base * 2^attempt, capped
+        delay = min(base * 2 ** attempt, CONFIG['NETWORK'].get('RETRY_BACKOFF_MAX_SECONDS', 60))
+        return delay / 2 + delay / 2 * random.getrandbits(8) / 255
+
+HEALTH = Endpoint_health()
+
+class Clock_drift():
+    # How fast the RTC runs against NTP, in seconds gained per second (negative when it loses time),
+    # kept on flash for this board. Every sync at least CLOCK.MIN_DRIFT_SAMPLE_MINUTES after the
+    # previous one adds a sample to a moving average. Between syncs now() takes the expected drift
+    # off the RTC, and the deep sleep timer, which counts on the RTC's own clock, is stretched to
+    # match by get_sleep_ms().
+    def __init__(self):
+        self.state = None
+        self.min_sample = CONFIG.get('CLOCK', {}).get('MIN_DRIFT_SAMPLE_MINUTES', 120) * 60
+        self.weight = 0.25
+    def load(self):
+        if self.state is None:
+            self.state = {'rate': 0.0, 'samples': 0, 'synced_at': None}
+            if DRIFT_FILE in os.listdir():
+                try:
+                    with open(DRIFT_FILE, 'r') as f:
+                        self.state = json.load(f)
+                except Exception as e:
+                    log(f'  >> Failed to read clock drift, starting uncalibrated. error: {e}')
+        return self.state
+    def calibrated(self):
+        return self.load()['samples'] > 0
+    def record_sync(self, before, trusted):
+        # `before` is the RTC reading taken just ahead of the sync. An RTC that was never synced
+        # since it powered on (`trusted` False) has nothing to measure.
+        state = self.load()
+        now = time.time()
+        last = state['synced_at']
+        if trusted and last is not None and now - last >= self.min_sample:
+            sample = (before - now) / (now - last)
+            if abs(sample) < MAX_CLOCK_DRIFT:
+                if state['samples'] == 0:
+                    state['rate'] = sample
+                else:
+                    state['rate'] = state['rate'] + self.weight * (sample - state['rate'])
+                state['samples'] = state['samples'] + 1
+                log(f'  >> RTC was {before - now} seconds off after {round((now - last)/60)} minutes, drift is now {round(state["rate"] * 1000000)} ppm')
+        state['synced_at'] = now
+        with open(DRIFT_FILE, 'w') as f:
+            f.write(json.dumps(state))
+    def now(self):
+        seconds = time.time()
+        state = self.load()
+        if not RTC_SYNCED or state['synced_at'] is None:
+            return seconds
+        return seconds - round(state['rate'] * (seconds - state['synced_at']) / (1 + state['rate']))
+    def get_sleep_ms(self, seconds):
+        return round(seconds * (1 + self.load()['rate']) * 1000)
+
+CLOCK = Clock_drift()
+
+class Forecast():
+    # Each of FORECAST_METRICS for FORECAST_HOURS consecutive hours from `start`, a local hour
+    # epoch, in fixed width arrays. FORECAST_MISSING marks an hour or field no provider filled in.
+    def __init__(self, start):
+        self.start = start
+        self.values = {}
+        for metric in FORECAST_METRICS:
+            self.values[metric] = array(FORECAST_TYPECODES[metric], [FORECAST_MISSING] * FORECAST_HOURS)
+    def get_index(self, epoch):
+        index = (epoch - self.start) // 3600
+        if index < 0 or index >= FORECAST_HOURS:
+            return -1
+        return index
+    def has(self, index):
+        if index < 0:
+            return False
+        for metric in FORECAST_METRICS:
+            if self.values[metric][index] != FORECAST_MISSING:
+                return True
+        return False
+    def set(self, epoch, record):
+        index = self.get_index(epoch)
+        if index < 0:
+            return
+        for metric in FORECAST_METRICS:
+            value = record.get(metric)
+            if value is None:
+                continue
+            if metric == 'rain':
+                self.values[metric][index] = min(100, max(0, round(value)))
+            else:
+                self.values[metric][index] = min(32767, max(-127, round(value)))
+    def fill_from(self, other):
+        # Only hours or fields still missing here are taken from other
+        shift = (self.start - other.start) // 3600
+        for metric in FORECAST_METRICS:
+            values = self.values[metric]
+            source_values = other.values[metric]
+            for index in range(FORECAST_HOURS):
+                source = index + shift
+                if 0 <= source < FORECAST_HOURS and values[index] == FORECAST_MISSING:
+                    values[index] = source_values[source]
+    def count(self):
+        hours = 0
+        for index in range(FORECAST_HOURS):
+            if self.has(index):
+                hours = hours + 1
+        return hours
+
+class Forecast_store():
+    # The last fetched Forecast, kept on flash as a header and the raw arrays. Hourly wakes render
+    # from it and only go back to the network when it is too old or no longer covers the LEDs. The
+    # per LED slot arrays handed to the renderer are allocated once and refilled in place.
+    def __init__(self):
+        self.loaded = False
+        self.fetched = None
+        self.forecast = None
+        self.max_age = CONFIG.get('FORECAST', {}).get('MAX_AGE_MINUTES', 180) * 60
+        self.slots = {}
+        for metric in FORECAST_METRICS:
+            self.slots[metric] = array(FORECAST_TYPECODES[metric], [FORECAST_MISSING] * WINDOW_HOURS)
+    def load(self):
+        global UTC_OFFSET
+        if self.loaded:
+            return
+        self.loaded = True
+        if FORECAST_STORE_FILE not in os.listdir():
+            return
+        try:
+            with open(FORECAST_STORE_FILE, 'rb') as f:
+                magic, version, count, offset, fetched, start = struct.unpack(FORECAST_HEADER, f.read(struct.calcsize(FORECAST_HEADER)))
+                if magic != FORECAST_MAGIC or version != 2 or count != FORECAST_HOURS:
+                    raise ValueError('unknown layout')
+                forecast = Forecast(start)
+                for metric in FORECAST_METRICS:
+                    f.readinto(forecast.values[metric])
+            self.fetched = fetched
+            self.forecast = forecast
+            if UTC_OFFSET is None:
+                UTC_OFFSET = offset
+        except Exception as e:
+            log(f'  >> Failed to read stored forecast, ignoring it. error: {e}')
+    def update(self, forecast):
+        self.loaded = True
+        self.fetched = time.time()
+        self.forecast = forecast
+        with open(FORECAST_STORE_FILE, 'wb') as f:
+            f.write(struct.pack(FORECAST_HEADER, FORECAST_MAGIC, 2, FORECAST_HOURS, UTC_OFFSET, self.fetched, forecast.start))
+            for metric in FORECAST_METRICS:
+                f.write(forecast.values[metric])
+    def get_midnight(self):
+        local_now = time.time() + UTC_OFFSET
+        return local_now - local_now % 86400
+    def find(self, hour, midnight):
+        # Index of an LED hour in the forecast. Hours already past today fall back to tomorrow.
+        index = self.forecast.get_index(midnight + hour * 3600)
+        if hour < HOUR and not self.forecast.has(index):
+            index = self.forecast.get_index(midnight + hour * 3600 + 86400)
+        return index
+    def needs_refresh(self):
+        self.load()
+        if self.fetched is None:
+            log('  >> No stored forecast')
+            return True
+        age = time.time() - self.fetched
+        if age < 0 or age > self.max_age:
+            log(f'  >> Stored forecast is {round(age/60)} minutes old')
+            return True
+        midnight = self.get_midnight()
+        for hour in get_led_window_hours():
+            if hour >= HOUR and not self.forecast.has(self.forecast.get_index(midnight + hour * 3600)):
+                log(f'  >> Stored forecast does not cover hour {hour}')
+                return True
+        return False
+    def get_slots(self):
+        log('  Mapping stored forecast to LED slots')
+        self.load()
+        midnight = self.get_midnight()
+        first = CONFIG['LED']['FIRST_BAR_HOUR']
+        for slot in range(WINDOW_HOURS):
+            index = -1 if self.forecast is None else self.find(first + slot, midnight)
+            for metric in FORECAST_METRICS:
+                self.slots[metric][slot] = FORECAST_MISSING if index < 0 else self.forecast.values[metric][index]
+            if DEBUG_LOGGING:
+                log(f'    >> Mapping hour {first + slot} to forecast index {index}', level=LOG_DEBUG)
+        return self.slots
+
+FORECAST_STORE = Forecast_store()
+
+class Last_frame():
+    # The last forecast drawn, as one bucket per metric and LED window slot plus the local midnight
+    # they are relative to, so a reset can draw it again before the network is up. FRAME_NO_DATA
+    # marks an unlit slot. Only written when it differs from what is already on flash.
+    def __init__(self):
+        self.count = WINDOW_HOURS
+        self.size = struct.calcsize(FRAME_HEADER)
+        self.buffer = bytearray(self.size + self.count * len(FORECAST_METRICS))
+        self.saved = None
+    def save(self, slots):
+        struct.pack_into(FRAME_HEADER, self.buffer, 0, FRAME_MAGIC, 2, CONFIG['LED']['FIRST_BAR_HOUR'], self.count, UTC_OFFSET, FORECAST_STORE.fetched or 0, FORECAST_STORE.get_midnight())
+        offset = self.size
+        for metric in FORECAST_METRICS:
+            values = slots[metric]
+            for slot in range(self.count):
+                bucket = get_bucket(values[slot])
+                self.buffer[offset + slot] = FRAME_NO_DATA if bucket < 0 else bucket
+            offset = offset + self.count
+        if self.buffer == self.saved:
+            return
+        with open(FRAME_FILE, 'wb') as f:
+            f.write(self.buffer)
+        if self.saved is None:
+            self.saved = bytearray(self.buffer)
+        else:
+            self.saved[:] = self.buffer
+    def load(self, slots):
+        # Fills the slot arrays from the saved frame and returns (utc offset, fetched, midnight), or None
+        if FRAME_FILE not in os.listdir():
+            return None
+        with open(FRAME_FILE, 'rb') as f:
+            data = f.read()
+        if len(data) != len(self.buffer):
+            return None
+        magic, version, first_hour, count, offset, fetched, midnight = struct.unpack_from(FRAME_HEADER, data)
+        if magic != FRAME_MAGIC or version != 2 or first_hour != CONFIG['LED']['FIRST_BAR_HOUR'] or count != self.count:
+            return None
+        self.saved = bytearray(data)
+        position = self.size
+        for metric in FORECAST_METRICS:
+            values = slots[metric]
+            for slot in range(count):
+                bucket = data[position + slot]
+                values[slot] = FORECAST_MISSING if bucket == FRAME_NO_DATA else bucket * 10
+            position = position + count
+        return offset, fetched, midnight
+
+LAST_FRAME = Last_frame()
+
+class Metrics_journal():
+    # One fixed size record per measured phase: sequence, RTC time, phase, reset cause, retries, ok,
+    # duration ms, free heap before and after, and response bytes. Records are buffered for the
+    # cycle and written to a ring of SLOTS records in metrics.bin in one pass; the header holds the
+    # layout and the next sequence number. tools/metrics_reader.py decodes the file on a host.
+    def __init__(self, slots, pending=16):
+        self.slots = slots
+        self.header_size = struct.calcsize(METRICS_HEADER)
+        self.record_size = struct.calcsize(METRICS_RECORD)
+        self.pending = bytearray(self.record_size * pending)
+        self.pending_count = 0
+        self.bytes = 0
+        self.retries = 0
+        self.reset_cause = machine.reset_cause()
+    def add_bytes(self, count):
+        self.bytes = self.bytes + count
+    def add_retry(self):
+        self.retries = self.retries + 1
+    def start(self):
+        return (time.ticks_ms(), gc.mem_free(), self.bytes, self.retries)
+    def stop(self, phase, started, ok=True):
+        if not self.slots:
+            return
+        if self.pending_count * self.record_size == len(self.pending):
+            self.flush()
+        struct.pack_into(METRICS_RECORD, self.pending, self.pending_count * self.record_size,
+            0, time.time(), METRICS_PHASES.index(phase), self.reset_cause, min(self.retries - started[3], 255),
+            1 if ok else 0, time.ticks_diff(time.ticks_ms(), started[0]), started[1], gc.mem_free(), self.bytes - started[2])
+        self.pending_count = self.pending_count + 1
+    def measure(self, phase, function, *args, **kwargs):
+        started = self.start()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.stop(phase, started, ok=False)
+            raise
+        self.stop(phase, started)
+        return result
+    async def measure_async(self, phase, awaitable):
+        started = self.start()
+        try:
+            result = await awaitable
+        except Exception:
+            self.stop(phase, started, ok=False)
+            raise
+        self.stop(phase, started)
+        return result
+    def open(self):
+        # Returns the journal and its next sequence number, starting a new file if the layout changed
+        if METRICS_FILE in os.listdir():
+            f = open(METRICS_FILE, 'r+b')
+            data = f.read(self.header_size)
+            if len(data) == self.header_size:
+                header = struct.unpack(METRICS_HEADER, data)
+                if header[:4] == (METRICS_MAGIC, 1, self.record_size, self.slots):
+                    return f, header[6]
+            f.close()
+        f = open(METRICS_FILE, 'wb')
+        f.write(struct.pack(METRICS_HEADER, METRICS_MAGIC, 1, self.record_size, self.slots, time.localtime(0)[0], 0, 1))
+        return f, 1
+    def flush(self):
+        if not self.pending_count:
+            return
+        f, sequence = self.open()
+        try:
+            view = memoryview(self.pending)
+            for index in range(self.pending_count):
+                offset = index * self.record_size
+                struct.pack_into('<I', self.pending, offset, sequence)
+                f.seek(self.header_size + (sequence - 1) % self.slots * self.record_size)
+                f.write(view[offset:offset + self.record_size])
+                sequence = sequence + 1
+            f.seek(0)
+            f.write(struct.pack(METRICS_HEADER, METRICS_MAGIC, 1, self.record_size, self.slots, time.localtime(0)[0], 0, sequence))
+        finally:
+            f.close()
+        self.pending_count = 0
+
+# METRICS.SLOTS of 0 turns the journal off
+METRICS = Metrics_journal(CONFIG.get('METRICS', {}).get('SLOTS', 512))
+
+def confirm_update():
+    if UPDATE_MARKER_FILE not in os.listdir():
+        return
+    try:
+        with open(UPDATE_MARKER_FILE, 'r') as f:
+            marker = json.load(f)
+        log(f'Update to {marker["version"]} reached main_loop, confirming it')
+    except Exception as e:
+        log(f'Update marker is unreadable, removing it. Error: {e}')
+    os.remove(UPDATE_MARKER_FILE)
+
+# Providers live in their own modules and are imported only while a fetch needs them
+PROVIDERS = {
+    'weatherapi':  ('provider_weatherapi', 'WeatherAPI'),
+    'accuweather': ('provider_accuweather', 'Accuweather'),
+    'weathergov':  ('provider_weathergov', 'WeatherGOV'),
+    'gateway':     ('provider_gateway', 'Gateway'),
+}
+# Everything load_module may have imported, dropped again by release_modules at the end of a refresh
+ON_DEMAND_MODULES = ('updater', 'animator', 'json_stream') + tuple([PROVIDERS[name][0] for name in PROVIDERS])
+
+def load_module(name):
+    return __import__(name)
+
+def release_modules():
+    for name in ON_DEMAND_MODULES:
+        if name in sys.modules:
+            del sys.modules[name]
+    gc.collect()
+
+def get_provider(name):
+    module, provider = PROVIDERS[name]
+    return getattr(load_module(module), provider)
+
+class Scheduler():
+    # Every wake-up comes from one queue of deadlines on the drift corrected clock: 'hourly' at the
+    # top of each hour from LED.ON_HOUR until LED.OFF_HOUR, 'off' at OFF_HOUR, 'update' at ON_HOUR
+    # and, until the RTC drift is calibrated, 'resync' CLOCK.RESYNC_LEAD_MINUTES before ON_HOUR.
+    # Tasks that share a deadline run in one wake-up and one online session. A cold boot runs update
+    # and hourly at once, and show_forecast keeps the strips dark if that is outside the lit hours.
+    # With POWER.DEEP_SLEEP the board is powered down for every wait and main() resumes the tasks
+    # from the sleep state.
+    def __init__(self):
+        clock_config = CONFIG.get('CLOCK', {})
+        self.margin = clock_config.get('WAKE_MARGIN_SECONDS', 2)
+        self.resync_lead = clock_config.get('RESYNC_LEAD_MINUTES', 30) * 60
+    def is_lit(self, hour):
+        on_hour = CONFIG['LED']['ON_HOUR']
+        lit_hours = (CONFIG['LED']['OFF_HOUR'] - on_hour) % 24 or 24
+        return (hour - on_hour) % 24 < lit_hours
+    def get_queue(self, now):
+        if not RTC_SYNCED or UTC_OFFSET is None:
+            # Without the local time all that can be done is to try again in an hour
+            return [((now // 3600 + 1) * 3600, 'hourly')]
+        first = ((now + UTC_OFFSET) // 3600 + 1) * 3600 - UTC_OFFSET
+        queue = []
+        for index in range(24):
+            deadline = first + index * 3600
+            hour = (deadline + UTC_OFFSET) // 3600 % 24
+            if self.is_lit(hour):
+                queue.append((deadline, 'hourly'))
+            elif self.is_lit(hour - 1):
+                queue.append((deadline, 'off'))
+            if hour == CONFIG['LED']['ON_HOUR']:
+                queue.append((deadline, 'update'))
+                if not CLOCK.calibrated() and not self.is_lit(hour - 1) and deadline - self.resync_lead > now:
+                    queue.append((deadline - self.resync_lead, 'resync'))
+        return queue
+    def run(self, then=None):
+        # A cold boot runs the ON_HOUR tasks straight away
+        if then is None:
+            self.run_tasks(['update', 'hourly'])
+        else:
+            self.wait(then['deadline'], then['tasks'])
+        while True:
+            queue = self.get_queue(CLOCK.now())
+            deadline = min(queue)[0]
+            self.wait(deadline, [task for at, task in queue if at == deadline])
+    def wait(self, deadline, tasks):
+        # The margin makes sure the local hour has turned over by the time the tasks run. A wake a
+        # little early waits out the rest awake rather than booting again.
+        seconds = deadline + self.margin - CLOCK.now()
+        if seconds > 0:
+            log(f'Will run {", ".join(tasks)} in {seconds // 60} minutes, {seconds % 60} seconds')
+            if POWER_CONFIG.get('DEEP_SLEEP', False) and seconds > 60:
+                enter_deep_sleep(seconds, then={'deadline': deadline, 'tasks': tasks})
+            time.sleep(seconds)
+        self.run_tasks(tasks)
+    def run_tasks(self, tasks):
+        global UPDATE_DUE
+        if 'update' in tasks:
+            UPDATE_DUE = True
+        if 'resync' in tasks:
+            log('Resyncing the clock ahead of ON_HOUR')
+            try:
+                run_online(self.resync_time())
+            except Exception as e:
+                log(f'  >> Resync failed, waking on the uncorrected clock. Error: {type(e).__name__} {e}')
+        if 'off' in tasks:
+            log('OFF_HOUR, turning the LEDs off until ON_HOUR')
+            set_LEDs(color='off')
+        if 'hourly' in tasks:
+            main_loop()
+    async def resync_time(self):
+        try:
+            await connect_wifi()
+            await sync_time()
+        finally:
+            disconnect_wifi()
+
+SCHEDULER = Scheduler()
+
+class Panel():
+    # One strip or matrix on its own data pin. `slots` holds the LED window slot shown by every
+    # pixel (NO_SLOT for pixels past the last hour), worked out once at boot so a render is one
+    # pass over the pixel buffer and one write.
+    def __init__(self, index, config):
+        self.name = config.get('NAME', str(index))
+        self.metric = config['METRIC']
+        self.gradient = config.get('GRADIENT', METRIC_GRADIENTS[self.metric])
+        hours = get_panel_hours(config)
+        if 'WIDTH' in config:
+            width = config['WIDTH']
+            height = config['HEIGHT']
+            count = width * height
+            columns_per_hour = max(1, width // hours)
+        else:
+            pixels_per_hour = config.get('PIXELS_PER_HOUR', 1)
+            count = config.get('COUNT', hours * pixels_per_hour)
+        self.slots = bytearray(count)
+        for pixel in range(count):
+            if 'WIDTH' in config:
+                if config.get('WIRING', 'rows') == 'rows':
+                    row = pixel // width
+                    column = pixel % width
+                    if config.get('SERPENTINE', False) and row % 2:
+                        column = width - 1 - column
+                else:
+                    column = pixel // height
+                if config.get('REVERSED', False):
+                    column = width - 1 - column
+                slot = column // columns_per_hour
+            else:
+                position = count - 1 - pixel if config.get('REVERSED', False) else pixel
+                slot = position // pixels_per_hour
+            self.slots[pixel] = slot if slot < hours else NO_SLOT
+        self.strip = NeoPixel(machine.Pin(config['GPIO_PIN'], machine.Pin.OUT), count)
+    def render(self, values, brightness, currentHour):
+        if brightness > 100:
+            brightness = 100
+        log(f'Setting LEDs on {self.name}. Brightness: {brightness}')
+        past = get_palette(self.gradient, round(brightness/4))
+        future = get_palette(self.gradient, brightness)
+        current = get_palette(self.gradient, 100)
+        first = CONFIG['LED']['FIRST_BAR_HOUR']
+        buf = self.strip.buf
+        bpp = self.strip.bpp
+        slots = self.slots
+        for pixel in range(len(slots)):
+            offset = pixel * bpp
+            slot = slots[pixel]
+            bucket = -1 if slot == NO_SLOT else get_bucket(values[slot])
+            if bucket < 0:
+                buf[offset] = 0
+                buf[offset + 1] = 0
+                buf[offset + 2] = 0
+                continue
+            hour = first + slot
+            if hour == currentHour:
+                palette = current
+            elif hour < currentHour:
+                palette = past
+            else:
+                palette = future
+            bucket = bucket * 3
+            buf[offset] = palette[bucket]
+            buf[offset + 1] = palette[bucket + 1]
+            buf[offset + 2] = palette[bucket + 2]
+        write_strip(self.strip)
+
+def init_neopixel():
+    log('Initializing NeoPixel Variables')
+    global NP, PANELS
+    NP = {}
+    PANELS = []
+    for index, config in enumerate(PANEL_CONFIGS):
+        panel = Panel(index, config)
+        PANELS.append(panel)
+        NP[panel.name] = panel.strip
+
+def get_led_pins():
+    pins = {}
+    for index, config in enumerate(PANEL_CONFIGS):
+        pins[config.get('NAME', str(index))] = config['GPIO_PIN']
+    return pins
+
+# WS2812 pixels latch the last frame they were sent for as long as their supply stays up, so the
+# forecast can stay lit while the board is in deep sleep. The data pins are held low through the
+# sleep so a floating line cannot clock garbage into the strips. The strips' own quiescent draw
+# (roughly 1mA per pixel even when dark) remains; POWER.LEDS_DARK_IN_SLEEP blanks them before
+# sleeping for installs that would rather show nothing than pay for a lit display.
+def hold_led_pins(hold):
+    for pin in get_led_pins().values():
+        try:
+            if hold:
+                machine.Pin(pin, machine.Pin.OUT, value=0, hold=True)
+            else:
+                machine.Pin(pin, machine.Pin.OUT, hold=False)
+        except (TypeError, ValueError):
+            return
+    try:
+        import esp32
+        esp32.gpio_deep_sleep_hold(hold)
+    except (ImportError, AttributeError):
+        pass
+
+def save_sleep_state(then):
+    frames = {}
+    for name in NP:
+        if NP[name] in LAST_FRAMES:
+            frames[name] = binascii.hexlify(LAST_FRAMES[NP[name]]).decode()
+    state = json.dumps({
+        'hour': globals().get('HOUR'),
+        'day': globals().get('DAY'),
+        'offset': UTC_OFFSET,
+        'synced': RTC_SYNCED,
+        'shown': FORECAST_SHOWN,
+        'frames': frames,
+        'then': then,
+    })
+    try:
+        RTC.memory(state.encode())
+        log('  >> Sleep state saved to RTC memory')
+    except (AttributeError, ValueError):
+        # An older state left in RTC memory would be restored ahead of this file
+        clear_rtc_memory()
+        with open(SLEEP_STATE_FILE, 'w') as f:
+            f.write(state)
+        log('  >> Sleep state saved to flash')
+
+def clear_rtc_memory():
+    try:
+        RTC.memory(b'')
+    except AttributeError:
+        pass
+
+def load_sleep_state():
+    # A state is only restored once, wherever it was kept
+    data = b''
+    try:
+        data = RTC.memory()
+    except AttributeError:
+        pass
+    if data:
+        clear_rtc_memory()
+    if not data and SLEEP_STATE_FILE in os.listdir():
+        with open(SLEEP_STATE_FILE, 'r') as f:
+            data = f.read()
+        os.remove(SLEEP_STATE_FILE)
+    if not data:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+def restore_sleep_state():
+    global HOUR, DAY, UTC_OFFSET, RTC_SYNCED, FORECAST_SHOWN
+    if machine.reset_cause() != getattr(machine, 'DEEPSLEEP_RESET', None):
+        return None
+    state = load_sleep_state()
+    if state is None:
+        return None
+    log('Woke from deep sleep, restoring state')
+    hold_led_pins(False)
+    init_neopixel()
+    HOUR = state['hour']
+    DAY = state['day']
+    UTC_OFFSET = state['offset']
+    RTC_SYNCED = state['synced']
+    FORECAST_SHOWN = state.get('shown', False)
+    for name in state['frames']:
+        if name in NP:
+            frame = binascii.unhexlify(state['frames'][name])
+            NP[name].buf[:] = frame
+            LAST_FRAMES[NP[name]] = bytearray(frame)
+    return state
+
+def enter_deep_sleep(seconds, then=None):
+    log(f'Entering deep sleep for {seconds} seconds')
+    if POWER_CONFIG.get('LEDS_DARK_IN_SLEEP', False):
+        set_LEDs(color='off')
+    save_sleep_state(then)
+    METRICS.flush()
+    hold_led_pins(True)
+    machine.deepsleep(CLOCK.get_sleep_ms(seconds))
+
+def write_user_config(config=CONFIG):
+    with open(CONFIG_FILE, 'w') as f:
+        f.write(json.dumps(config))
+
+async def call_with_retry(name, request, message):
+    # Calls request() until it succeeds, backing off between attempts and recording each outcome
+    # against `name`. Raises the last error once MAX_REQUEST_RETRIES attempts have failed.
+    max_retries = CONFIG['NETWORK']['MAX_REQUEST_RETRIES']
+    attempt = 0
+    while True:
+        started = time.ticks_ms()
+        try:
+            result = await request()
+        except Exception as e:
+            HEALTH.record(name, False)
+            attempt = attempt + 1
+            log(f'  {message}, attempt {attempt}/{max_retries}. Error: {type(e).__name__} {e}')
+            if attempt >= max_retries or not HEALTH.allow(name):
+                raise
+            METRICS.add_retry()
+            delay = HEALTH.get_backoff(attempt - 1, CONFIG['NETWORK']['REQUEST_RETRY_DELAY_SECONDS'])
+            log(f'  Pausing {round(delay, 1)} seconds before next attempt')
+            await asyncio.sleep(delay)
+        else:
+            HEALTH.record(name, True, time.ticks_diff(time.ticks_ms(), started))
+            return result
+
+async def make_network_request_with_retry(url, message, stream=False):
+    log(f'  Making GET request to {url}')
+    host = url.split('/')[2]
+    if not HEALTH.allow(host):
+        return None
+    async def request():
+        response = await HTTP.get(url)
+        if stream:
+            return response
+        return await response.json()
+    try:
+        return await call_with_retry(host, request, message)
+    except Exception:
+        return None
+
+class Http_response():
+    # The body is framed by Content-Length or chunked encoding, so once it has been read to the end
+    # the connection can go back to the pool. A response closed part way through (a stream that
+    # stopped early) closes its connection instead.
+    def __init__(self, client, key, reader, writer):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status_code = None
+        self.headers = {}
+        self.keep_alive = False
+        self.chunked = False
+        self.remaining = None
+        self.done = False
+        self.body_bytes = 0
+    async def read_line(self):
+        return await asyncio.wait_for(self.reader.readline(), self.client.read_timeout)
+    async def read_head(self):
+        line = await self.read_line()
+        if not line:
+            raise OSError('Connection closed before the response')
+        parts = line.split(None, 2)
+        self.status_code = int(parts[1])
+        self.keep_alive = parts[0] == b'HTTP/1.1'
+        while True:
+            line = await self.read_line()
+            if not line or line == b'\r\n':
+                break
+            name, _, value = line.decode().partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        if self.headers.get('connection', '').lower() == 'close':
+            self.keep_alive = False
+        if self.status_code in (204, 304):
+            self.done = True
+        elif 'chunked' in self.headers.get('transfer-encoding', ''):
+            self.chunked = True
+            self.remaining = 0
+        elif 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+            self.done = self.remaining == 0
+        else:
+            # Unframed, the body runs until the server closes the connection
+            self.keep_alive = False
+    async def read(self, size):
+        if self.done:
+            return b''
+        if self.chunked and self.remaining == 0:
+            self.remaining = int((await self.read_line()).split(b';')[0].strip(), 16)
+            if self.remaining == 0:
+                while (await self.read_line()) not in (b'\r\n', b''):
+                    pass
+                self.done = True
+                return b''
+        if self.remaining is not None and size > self.remaining:
+            size = self.remaining
+        data = await asyncio.wait_for(self.reader.read(size), self.client.read_timeout)
+        if not data:
+            if self.remaining is not None:
+                raise OSError('Connection closed part way through the body')
+            self.done = True
+            return b''
+        METRICS.add_bytes(len(data))
+        self.body_bytes = self.body_bytes + len(data)
+        if self.body_bytes > self.client.max_body:
+            raise ValueError(f'Response body is larger than {self.client.max_body} bytes')
+        if self.remaining is not None:
+            self.remaining = self.remaining - len(data)
+            if self.remaining == 0:
+                if self.chunked:
+                    await asyncio.wait_for(self.reader.readexactly(2), self.client.read_timeout)
+                else:
+                    self.done = True
+        return data
+    async def read_all(self, limit=JSON_BUFFER_BYTES):
+        try:
+            if self.status_code != 200:
+                raise ValueError(f'Request failed with status {self.status_code}')
+            if self.remaining is not None and self.remaining > limit:
+                raise ValueError(f'Response of {self.remaining} bytes is too large to buffer')
+            content = b''
+            while True:
+                chunk = await self.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                content = content + chunk
+                if len(content) > limit:
+                    raise ValueError(f'Response is larger than {limit} bytes')
+        finally:
+            self.close()
+        return content
+    async def json(self):
+        return json.loads(await self.read_all())
+    async def text(self):
+        return (await self.read_all()).decode()
+    def close(self):
+        if self.writer is None:
+            return
+        if self.done and self.keep_alive:
+            self.client.release(self.key, self.reader, self.writer)
+        else:
+            self.writer.close()
+        self.writer = None
+
+class Http_client():
+    # Keeps one idle keep-alive connection per host:port, so every request to the same host in a
+    # cycle shares one TCP connect and one TLS handshake. Pooled connections belong to the event
+    # loop that opened them; run_online empties the pool before its loop stops.
+    def __init__(self):
+        self.connect_timeout = CONFIG['NETWORK'].get('CONNECT_TIMEOUT_SECONDS', 10)
+        self.read_timeout = CONFIG['NETWORK'].get('READ_TIMEOUT_SECONDS', 10)
+        self.max_body = CONFIG['NETWORK'].get('MAX_BODY_BYTES', 262144)
+        self.pool = {}
+        self.ssl_context = None
+    def get_ssl_context(self):
+        # Certificates are not verified, same as urequests
+        if self.ssl_context is None:
+            import ssl
+            self.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            if hasattr(self.ssl_context, 'check_hostname'):
+                # CPython (the LAN gateway) refuses CERT_NONE while hostname checks are on
+                self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+        return self.ssl_context
+    def release(self, key, reader, writer):
+        if key in self.pool:
+            writer.close()
+        else:
+            self.pool[key] = (reader, writer)
+    def close(self):
+        for key in self.pool:
+            self.pool[key][1].close()
+        self.pool = {}
+    async def connect(self, scheme, host, port):
+        if DEBUG_LOGGING:
+            log(f'    >> Opening connection to {host}:{port}', level=LOG_DEBUG)
+        ssl = self.get_ssl_context() if scheme == 'https:' else None
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl), self.connect_timeout)
+    async def get(self, url, headers={}):
+        # A URL without a path (https://ip.me) asks for /
+        scheme, _, host, path = (url.split('/', 3) + [''])[:4]
+        port = 443 if scheme == 'https:' else 80
+        if ':' in host:
+            host, port = host.split(':')
+            port = int(port)
+        key = host + ':' + str(port)
+        request = 'GET /' + path + ' HTTP/1.1\r\nHost: ' + host + '\r\n'
+        for name in headers:
+            request = request + name + ': ' + headers[name] + '\r\n'
+        request = (request + '\r\n').encode()
+        pooled = self.pool.pop(key, None)
+        while True:
+            if pooled is None:
+                reader, writer = await self.connect(scheme, host, port)
+            else:
+                reader, writer = pooled
+            response = Http_response(self, key, reader, writer)
+            try:
+                writer.write(request)
+                await writer.drain()
+                await response.read_head()
+                return response
+            except BaseException as e:
+                writer.close()
+                # The server may have dropped an idle pooled connection, so that one gets a second try
+                if pooled is None or not isinstance(e, OSError):
+                    raise
+                pooled = None
+
+HTTP = Http_client()
+
+def run_online(awaitable):
+    async def run():
+        try:
+            return await awaitable
+        finally:
+            HTTP.close()
+            HEALTH.save()
+    return asyncio.run(run())
+
+async def get_local_worldtimeapi_time():
+    log('Getting local time from worldtimeapi')
+    url = 'http://worldtimeapi.org/api/timezone/'
+    url = url + CONFIG['LOCATION']['TIME_REGION']
+    response = await make_network_request_with_retry(url, message='Failed to get time')
+    global HOUR, DAY, UTC_OFFSET
+    if response:
+        log(f'  >> Local time {response["datetime"]} returned')
+        HOUR = int(response['datetime'].split('T')[1].split(":")[0])
+        DAY = int(response['datetime'].split('T')[0].split("-")[2])
+        UTC_OFFSET = response['raw_offset'] + response['dst_offset']
+    elif UTC_OFFSET is not None and RTC_SYNCED:
+        log('  >> Falling back to the RTC and the last known UTC offset')
+        set_local_time_from_RTC()
+
+def get_timezone():
+    location = CONFIG['LOCATION']
+    if 'UTC_OFFSET_MINUTES' in location:
+        return (location['UTC_OFFSET_MINUTES'], location.get('DST_RULE'))
+    return TIMEZONES.get(location['TIME_REGION'])
+
+def get_sunday(year, month, nth):
+    first_weekday = time.localtime(time.mktime((year, month, 1, 0, 0, 0, 0, 0, 0)))[6]
+    first_sunday = 1 + (6 - first_weekday) % 7
+    if nth > 0:
+        return first_sunday + 7 * (nth - 1)
+    day = first_sunday + 28
+    if time.localtime(time.mktime((year, month, day, 0, 0, 0, 0, 0, 0)))[1] != month:
+        day = day - 7
+    return day
+
+def get_dst_transition(year, transition, standard_offset):
+    month, nth, hour, is_utc = transition
+    epoch = time.mktime((year, month, get_sunday(year, month, nth), hour, 0, 0, 0, 0, 0))
+    if is_utc:
+        return epoch
+    return epoch - standard_offset
+
+def get_utc_offset(utc_now, timezone):
+    standard_offset = timezone[0] * 60
+    if timezone[1] is None:
+        return standard_offset
+    year = time.localtime(utc_now)[0]
+    start_rule, end_rule = DST_RULES[timezone[1]]
+    start = get_dst_transition(year, start_rule, standard_offset)
+    end = get_dst_transition(year, end_rule, standard_offset)
+    if start < end:
+        daylight = start <= utc_now < end
+    else:
+        daylight = utc_now >= start or utc_now < end
+    return standard_offset + 3600 if daylight else standard_offset
+
+async def update_local_time():
+    log('Getting local time')
+    if get_timezone() is None:
+        log(f'  >> {CONFIG["LOCATION"]["TIME_REGION"]} is not in the built in timezone table')
+        await get_local_worldtimeapi_time()
+        return
+    set_local_time_from_RTC()
+    log(f'  >> Local hour {HOUR}, day {DAY}, UTC offset {UTC_OFFSET // 60} minutes')
+
+def set_local_time_from_RTC():
+    global HOUR, DAY, UTC_OFFSET
+    utc_now = CLOCK.now()
+    timezone = get_timezone()
+    if timezone is not None:
+        UTC_OFFSET = get_utc_offset(utc_now, timezone)
+    now = time.localtime(utc_now + UTC_OFFSET)
+    HOUR = now[3]
+    DAY = now[2]
+
+def get_epoch_from_stamp(stamp):
+    return time.mktime((int(stamp[0:4]), int(stamp[5:7]), int(stamp[8:10]), int(stamp[11:13]), 0, 0, 0, 0, 0))
+
+def get_current_time_in_RTC():
+    now = time.localtime(time.time() + UTC_OFFSET)
+    modified = (
+        now[0],
+        now[1],
+        now[2],
+        now[6],
+        now[3],
+        now[4],
+        now[5],
+        0
+    )  
+    return modified
+
+def load_wifi_cache():
+    if WIFI_CACHE_FILE not in os.listdir():
+        return None
+    try:
+        with open(WIFI_CACHE_FILE, 'r') as f:
+            cached = json.load(f)
+    except ValueError:
+        return None
+    if cached.get('ssid') != CONFIG['NETWORK']['SSID']:
+        return None
+    return cached
+
+def save_wifi_cache(access_point):
+    cached = {'ssid': CONFIG['NETWORK']['SSID'], 'bssid': access_point[0], 'channel': access_point[1]}
+    if load_wifi_cache() == cached:
+        return
+    log(f'  >> Remembering access point {access_point[0]} on channel {access_point[1]}')
+    with open(WIFI_CACHE_FILE, 'w') as f:
+        f.write(json.dumps(cached))
+
+def forget_wifi_cache():
+    if WIFI_CACHE_FILE in os.listdir():
+        os.remove(WIFI_CACHE_FILE)
+
+def find_access_point():
+    best = None
+    for network_info in WLAN.scan():
+        ssid, bssid, channel, rssi = network_info[0], network_info[1], network_info[2], network_info[3]
+        if ssid.decode() != CONFIG['NETWORK']['SSID']:
+            continue
+        if best is None or rssi > best[2]:
+            best = (binascii.hexlify(bssid).decode(), channel, rssi)
+    return best
+
+def configure_static_ip():
+    static = CONFIG['NETWORK'].get('STATIC_IP', {})
+    if not static.get('IP'):
+        return
+    log(f'  Using static IP {static["IP"]}, skipping DHCP')
+    WLAN.ifconfig((static['IP'], static['NETMASK'], static['GATEWAY'], static['DNS']))
+
+def start_wifi_join(access_point=None):
+    if access_point is None:
+        WLAN.connect(CONFIG['NETWORK']['SSID'], CONFIG['NETWORK']['PSK'])
+    else:
+        try:
+            WLAN.config(channel=access_point[1])
+        except (OSError, ValueError):
+            pass
+        WLAN.connect(CONFIG['NETWORK']['SSID'], CONFIG['NETWORK']['PSK'], bssid=binascii.unhexlify(access_point[0]))
+    if os.uname().sysname == 'rp2':
+        log('Disabling rp2 specific WiFi power saving settings')
+        WLAN.config(pm = 0xa11140)
+
+async def wait_for_wifi(timeout_seconds=None):
+    # Polls at CONNECT_POLL_MS; any status animation runs as its own task in the meantime
+    poll_ms = CONFIG['NETWORK'].get('CONNECT_POLL_MS', 100)
+    started = time.ticks_ms()
+    while not (WLAN.isconnected() and WLAN.ifconfig()[0] != '0.0.0.0'):
+        if timeout_seconds is not None and time.ticks_diff(time.ticks_ms(), started) > timeout_seconds * 1000:
+            return False
+        if DEBUG_LOGGING:
+            log(f'    IP: {WLAN.ifconfig()[0]}', level=LOG_DEBUG)
+        await asyncio.sleep_ms(poll_ms)
+    return True
+
+async def connect_wifi():
+    log('Connecting WiFi')
+    log(f'  Using wifi info:\n    SSID: {CONFIG["NETWORK"]["SSID"]}\n    PSK:  {CONFIG["NETWORK"]["PSK"]}')
+    if not WLAN.isconnected():
+        started = time.ticks_ms()
+        WLAN.active(True)
+        configure_static_ip()
+        timings = f'active {time.ticks_diff(time.ticks_ms(), started)}ms'
+        connected = False
+        cached = load_wifi_cache()
+        if cached is not None:
+            log(f'  Fast joining cached access point {cached["bssid"]} on channel {cached["channel"]}')
+            phase_start = time.ticks_ms()
+            try:
+                start_wifi_join((cached['bssid'], cached['channel']))
+                connected = await wait_for_wifi(CONFIG['NETWORK'].get('FAST_JOIN_TIMEOUT_SECONDS', 5))
+            except (OSError, TypeError) as e:
+                log(f'    >> Fast join failed. Error: {e}')
+            timings = timings + f', fast join {time.ticks_diff(time.ticks_ms(), phase_start)}ms'
+            if not connected:
+                log('    >> Fast join did not connect, falling back to a full scan')
+                WLAN.disconnect()
+                forget_wifi_cache()
+        if not connected:
+            phase_start = time.ticks_ms()
+            await asyncio.sleep_ms(500)
+            access_point = find_access_point()
+            timings = timings + f', scan {time.ticks_diff(time.ticks_ms(), phase_start)}ms'
+            phase_start = time.ticks_ms()
+            start_wifi_join()
+            # Bounded so a missing access point fails the cycle, which then draws the stored
+            # forecast and leaves the scheduler its next deadline, instead of holding the radio on
+            join_timeout = CONFIG['NETWORK'].get('JOIN_TIMEOUT_SECONDS', 30)
+            if not await wait_for_wifi(join_timeout):
+                raise OSError(f'WiFi did not connect within {join_timeout} seconds')
+            timings = timings + f', join {time.ticks_diff(time.ticks_ms(), phase_start)}ms'
+            if access_point is not None:
+                save_wifi_cache(access_point)
+        log('Connected!')
+        log(f'  >> IP: {WLAN.ifconfig()[0]}')
+        log(f'  >> Connected in {time.ticks_diff(time.ticks_ms(), started)}ms ({timings})')
+    else:
+        log(f"Already connected to wifi: {str(WLAN.ifconfig())}")
+
+def disconnect_wifi():
+    log('Disconnecting WiFi')
+    WLAN.disconnect()
+    log('Disabling WiFi')
+    WLAN.active(False)
+
+async def validate_internet_connection(tries_before_reconnect=4, max_tries=8):
+    # Gives up after max_tries with backoff between them, and the cycle keeps the stored forecast
+    log('Validating public internet connection')
+    retries = 0
+    while True:
+        try:
+            response = await HTTP.get('https://ip.me')
+            text = await response.text()
+            log(f'  Internet appears to be connected, Public IP: {text.strip()}')
+            play_effect('fetching')
+            return True
+        except Exception as e:
+            retries = retries + 1
+            if retries == max_tries:
+                log(f'  Internet connection not functional. Hit max retry count of {max_tries}, giving up until the next cycle')
+                return False
+            METRICS.add_retry()
+            play_effect('error')
+            delay = HEALTH.get_backoff(retries - 1, CONFIG['NETWORK']['INTERNET_CHECK_RETRY_SECONDS'])
+            if retries % tries_before_reconnect == 0:
+                log(f'  Internet connection not functional yet. Retry #{retries}/{max_tries}. Reconnecting wifi to troubleshoot')
+                HTTP.close()
+                disconnect_wifi()
+                log(f'Delaying {round(delay, 1)} seconds')
+                await asyncio.sleep(delay)
+                await connect_wifi()
+            else:
+                log(f'  Internet connection not functional yet. Retry #{retries}/{max_tries}. Trying again in {round(delay, 1)} seconds')
+                log(f'Error: {type(e).__name__} {e}')
+                await asyncio.sleep(delay)
+
+def update_RTC():
+    global RTC_SYNCED
+    log('Updating RTC time')
+    log("  Local time before synchronization：%s" %str(time.localtime()))
+    retries = 0
+    while retries < CONFIG['NETWORK']['MAX_REQUEST_RETRIES']:
+        try:
+            before = time.time()
+            ntptime.settime()
+            CLOCK.record_sync(before, RTC_SYNCED)
+            RTC_SYNCED = True
+            log("  Local time after synchronization：%s" %str(time.localtime()))
+            return True
+        except:
+            log(f'  Failed to get NTP time, retry {retries+1}/{CONFIG["NETWORK"]["MAX_REQUEST_RETRIES"]}')
+            retries = retries + 1
+            METRICS.add_retry()
+            log(f'  Pausing {CONFIG["NETWORK"]["REQUEST_RETRY_DELAY_SECONDS"]} seconds before next attempt')
+        if retries == CONFIG['NETWORK']['MAX_REQUEST_RETRIES']:
+            return False
+
+async def sync_time():
+    # A successful NTP exchange already proves the connection works, so the public internet check
+    # only runs to troubleshoot a failed sync. Returns whether the internet is reachable, and raises
+    # when the clock is still unknown, since nothing fetched could be placed against the local time.
+    online = True
+    if not METRICS.measure('ntp', update_RTC):
+        log('NTP sync failed, checking the internet connection')
+        online = await METRICS.measure_async('internet', validate_internet_connection())
+        if online and not METRICS.measure('ntp', update_RTC) and not RTC_SYNCED:
+            raise OSError('NTP sync failed and the RTC was never synced, keeping the stored forecast')
+    if online:
+        await METRICS.measure_async('time', update_local_time())
+    return online
+
+COLORS = {
+    'red':    (1, 0, 0),
+    'green':  (0, 1, 0),
+    'blue':   (0, 0, 1),
+    'yellow': (1, 1, 0),
+    'cyan':   (0, 1, 1),
+    'white':  (1, 1, 1),
+    'off':    (0, 0, 0),
+}
+# Share of the scaled brightness per RGB channel for each 10% bucket (0-100). None is off.
+GRADIENTS = {
+    'blueRed':  (None, None, None, (0, 0, 1), (.1, .2, .9), (.2, .3, .5), (.3, .5, .3), (.5, .3, .2), (.9, .2, .1), (1, 0, 0), None),
+    'greenRed': ((0, 1, 0), (.3, .8, 0), (.4, .7, 0), (.5, .6, 0), (.6, .5, 0), (.7, .4, 0), (.8, .3, 0), (.9, .3, 0), (.9, .2, 0), (.9, .1, 0), (1, 0, 0)),
+}
+PALETTES = {}
+LAST_FRAMES = {}
+
+def get_color(color, brightness):
+    brightness = round(255 * (brightness * .01))
+    ratios = COLORS[color] if color in COLORS else COLORS['off']
+    return (brightness * ratios[0], brightness * ratios[1], brightness * ratios[2])
+
+def get_palette(gradient, brightness):
+    # One 3 byte entry per bucket, already in the strip's wire order so rendering is a byte copy
+    key = gradient + str(brightness)
+    palette = PALETTES.get(key)
+    if palette is None:
+        scale = round(255 * (brightness * .01))
+        palette = bytearray(len(GRADIENTS[gradient]) * 3)
+        for bucket, ratios in enumerate(GRADIENTS[gradient]):
+            if ratios is not None:
+                for channel in range(3):
+                    palette[bucket * 3 + NeoPixel.ORDER[channel]] = round(scale * ratios[channel])
+        PALETTES[key] = palette
+    return palette
+
+def get_bucket(value):
+    if value == FORECAST_MISSING:
+        return -1
+    bucket = round(value / 10.0)
+    if bucket < 0 or bucket > 10:
+        return -1
+    return bucket
+
+def write_strip(strip):
+    frame = LAST_FRAMES.get(strip)
+    if frame is not None and frame == strip.buf:
+        if DEBUG_LOGGING:
+            log('  Strip unchanged, skipping write', level=LOG_DEBUG)
+        return False
+    if frame is None:
+        LAST_FRAMES[strip] = bytearray(strip.buf)
+    else:
+        frame[:] = strip.buf
+    strip.write()
+    return True
+
+def set_LEDs(color='', brightness=50, RGBValue=(0,0,0)):
+    if brightness > 100:
+        brightness = 100   
+    log(f'Setting LEDs. Brightness: {brightness}')
+
+    def set_all_strips(RGBValue):
+        for strip in NP.keys():
+            if DEBUG_LOGGING:
+                log(f'  Setting strip {strip} to value: {RGBValue}', level=LOG_DEBUG)
+            NP[strip].fill(RGBValue)
+            write_strip(NP[strip])
+
+    if RGBValue != (0,0,0):
+        set_all_strips(RGBValue)
+        return
+    else:
+        log(f'  Setting all LEDs to {get_color(color, brightness)}')
+        set_all_strips(get_color(color, brightness))
+        return
+
+# Set only while a refresh animates its progress (see animator.py)
+ANIMATOR = None
+
+def play_effect(effect):
+    if ANIMATOR is not None:
+        ANIMATOR.play(effect)
+
+def get_led_window_hours():
+    return range(CONFIG['LED']['FIRST_BAR_HOUR'], CONFIG['LED']['FIRST_BAR_HOUR'] + WINDOW_HOURS)
+
+def get_providers():
+    # Older configs name a single PROVIDER
+    return CONFIG.get('PROVIDERS') or [CONFIG['PROVIDER']]
+
+def merge_forecasts(providers, results):
+    # Earlier providers win, later ones only fill hours or fields the earlier ones left empty
+    merged = None
+    for name in providers:
+        if name in results:
+            if merged is None:
+                merged = Forecast(results[name].start)
+            merged.fill_from(results[name])
+    return merged
+
+def forecast_complete(merged):
+    midnight = FORECAST_STORE.get_midnight()
+    for hour in get_led_window_hours():
+        if hour < HOUR:
+            continue
+        index = merged.get_index(midnight + hour * 3600)
+        if index < 0:
+            return False
+        for metric in DISPLAY_METRICS:
+            if merged.values[metric][index] == FORECAST_MISSING:
+                return False
+    return True
+
+def get_available_providers(providers):
+    # Providers with an open circuit are skipped. If that leaves none, the healthiest one is tried.
+    available = [name for name in providers if HEALTH.allow(name)]
+    if not available:
+        best = max(providers, key=HEALTH.score)
+        log(f'  >> Every provider circuit is open, trying {best}')
+        available = [best]
+    return available
+
+async def fetch_forecast():
+    # Every provider is queried at once, each bounded by FETCH_TIMEOUT_SECONDS including its
+    # retries. As soon as the results so far cover the LED window the remaining requests are
+    # cancelled.
+    providers = get_available_providers(get_providers())
+    timeout = CONFIG['NETWORK'].get('FETCH_TIMEOUT_SECONDS', 15)
+    results = {}
+    finished = []
+    changed = asyncio.Event()
+    async def fetch(name):
+        try:
+            request = lambda: get_provider(name)().main()
+            results[name] = await asyncio.wait_for(call_with_retry(name, request, f'{name} failed'), timeout)
+            log(f'  >> {name} returned {results[name].count()} hours')
+        except asyncio.TimeoutError:
+            HEALTH.record(name, False)
+            log(f'  >> {name} timed out after {timeout} seconds')
+        except Exception as e:
+            log(f'  >> {name} failed. Error: {type(e).__name__} {e}')
+        finished.append(name)
+        changed.set()
+    tasks = {}
+    for name in providers:
+        tasks[name] = asyncio.create_task(fetch(name))
+    merged = None
+    try:
+        while len(finished) < len(providers):
+            await changed.wait()
+            changed.clear()
+            merged = merge_forecasts(providers, results)
+            if merged is not None and forecast_complete(merged):
+                log(f'  >> Forecast complete from {[name for name in providers if name in results]}')
+                break
+    finally:
+        for name in tasks:
+            if name not in finished:
+                log(f'  >> Cancelling {name}')
+                tasks[name].cancel()
+        # Let the cancelled requests close their sockets before the loop stops
+        await asyncio.sleep(0)
+    if merged is None or not merged.count():
+        raise ValueError('No provider returned a forecast')
+    return merged
+
+async def map_hours_to_pins():
+    log('Mapping hours to pins')
+    FORECAST_STORE.update(await fetch_forecast())
+    return FORECAST_STORE.get_slots()
+
+async def check_for_updates():
+    # The updater module is only imported when the scheduler's update task is due
+    global UPDATE_DUE
+    if not UPDATE_DUE:
+        log('  >> No update check due, skipping it')
+        return
+    UPDATE_DUE = False
+    await load_module('updater').Check_for_updates().main()
+
+async def refresh_forecast(useLEDs=True):
+    # Connection progress is animated only while the strips have no forecast to show
+    global ANIMATOR
+    if useLEDs:
+        ANIMATOR = load_module('animator').Animator()
+        ANIMATOR.start('connecting')
+    try:
+        await METRICS.measure_async('wifi', connect_wifi())
+        play_effect('fetching')
+        if not await sync_time():
+            raise OSError('No internet connection, keeping the stored forecast')
+        await METRICS.measure_async('update', check_for_updates())
+        return await METRICS.measure_async('fetch', map_hours_to_pins())
+    except Exception:
+        play_effect('error')
+        raise
+    finally:
+        if ANIMATOR is not None:
+            ANIMATOR.stop()
+            ANIMATOR = None
+        disconnect_wifi()
+        release_modules()
+
+def forecast_refresh_needed():
+    log('Checking stored forecast')
+    if not RTC_SYNCED or UTC_OFFSET is None and get_timezone() is None:
+        log('  >> Local time is unknown until the next sync')
+        return True
+    set_local_time_from_RTC()
+    if UPDATE_DUE:
+        log('  >> Update check due, refreshing so it can run')
+        return True
+    return FORECAST_STORE.needs_refresh()
+
+def show_forecast(slots, stale=False):
+    # The scheduler only runs cycles in the lit hours, but a cold boot between OFF_HOUR and ON_HOUR
+    # still runs one to sync the clock. It takes the off path rather than light the strips all night.
+    if not SCHEDULER.is_lit(HOUR):
+        log('Outside the LED hours, turning the LEDs off until ON_HOUR')
+        set_LEDs(color='off')
+        return
+    send_map_to_leds(slots, stale)
+
+def show_stored_forecast():
+    # After a failed refresh the current hour still moves along on whatever forecast.bin holds. Once
+    # it is older than FORECAST.MAX_AGE_MINUTES it is drawn at a quarter brightness, the same stale
+    # cue as show_last_frame.
+    if not RTC_SYNCED or UTC_OFFSET is None and get_timezone() is None:
+        log('  >> Local time is unknown, leaving the LEDs as they are')
+        return
+    FORECAST_STORE.load()
+    if FORECAST_STORE.fetched is None:
+        log('  >> No stored forecast to draw')
+        return
+    set_local_time_from_RTC()
+    age = time.time() - FORECAST_STORE.fetched
+    stale = age < 0 or age > FORECAST_STORE.max_age
+    log(f'Drawing the stored forecast from {round(age/60)} minutes ago{", stale" if stale else ""}')
+    show_forecast(FORECAST_STORE.get_slots(), stale)
+
+def send_map_to_leds(slots, stale=False):
+    global FORECAST_SHOWN
+    brightness = CONFIG['LED']['BRIGHTNESS']
+    if stale:
+        brightness = max(1, round(brightness / 4))
+    for panel in PANELS:
+        panel.render(slots[panel.metric], brightness, HOUR)
+    FORECAST_SHOWN = True
+    LAST_FRAME.save(slots)
+
+def show_last_frame():
+    # Draws the frame saved by the last render straight after a reset. The current hour is worked
+    # out from the RTC if it survived the reset. A frame older than FORECAST.MAX_AGE_MINUTES, or one
+    # shown without a usable clock, is drawn at a quarter brightness to mark it as stale.
+    global FORECAST_SHOWN
+    slots = FORECAST_STORE.slots
+    try:
+        frame = LAST_FRAME.load(slots)
+    except Exception as e:
+        log(f'  >> Failed to read the last frame. error: {e}')
+        return False
+    if frame is None:
+        return False
+    offset, fetched, midnight = frame
+    now = time.time()
+    currentHour = -1
+    stale = True
+    if fetched and now >= fetched:
+        currentHour = (now + offset - midnight) // 3600
+        stale = now - fetched > FORECAST_STORE.max_age
+    brightness = CONFIG['LED']['BRIGHTNESS']
+    if stale:
+        brightness = max(1, round(brightness / 4))
+    log(f'Drawing the last frame, current hour {currentHour}{", stale" if stale else ""}')
+    for panel in PANELS:
+        panel.render(slots[panel.metric], brightness, currentHour)
+    FORECAST_SHOWN = True
+    return True
+
+def rotate_log_file(path):
+    try:
+        size = os.stat(path)[6]
+    except OSError:
+        return
+    if size < LOG_MAX_FILE_BYTES:
+        return
+    backup = path + '.1'
+    if backup in os.listdir():
+        os.remove(backup)
+    os.rename(path, backup)
+
+def write_error_log(message):
+    log('Writing error log')
+    rotate_log_file(ERROR_LOG)
+    now = time.localtime()
+    with open(ERROR_LOG, 'a') as f:
+        f.write('%04d-%02d-%02d %02d:%02d:%02d %s\n' % (now[0], now[1], now[2], now[3], now[4], now[5], message))
+
+def flush_run_log():
+    rotate_log_file(RUN_LOG)
+    with open(RUN_LOG, 'ab') as f:
+        LOG_RING.dump(f)
+    LOG_RING.clear()
+
+def print_error_log():
+    if ERROR_LOG in os.listdir():
+        log('Printing error log')
+        with open(ERROR_LOG, 'r') as f:
+            print(f.read())
+
+def print_run_log():
+    if RUN_LOG in os.listdir():
+        log('Printing run log')
+        with open(RUN_LOG, 'r') as f:
+            print(f.read())
+
+def log(message, initialize=False, write_to_file=False, level=LOG_INFO):
+    if level < LOG_LEVEL:
+        return
+    if LOG_CONSOLE:
+        print(message)
+    if initialize:
+        LOG_RING.clear()
+    LOG_RING.write(message.encode())
+    LOG_RING.write(b'\n')
+    if write_to_file:
+        flush_run_log()
+
+def main_loop():
+    log('Starting Main Loop', initialize=True)
+    cycle = METRICS.start()
+    try:
+        confirm_update()
+        if forecast_refresh_needed():
+            # Connection progress is only drawn while the strips have no forecast to show
+            hourMap = run_online(refresh_forecast(not FORECAST_SHOWN))
+            METRICS.measure('leds', show_forecast, hourMap)
+        else:
+            log('Stored forecast is current, rendering it without connecting')
+            METRICS.measure('leds', show_forecast, FORECAST_STORE.get_slots())
+        METRICS.stop('cycle', cycle)
+        METRICS.flush()
+        return
+    except Exception as e:
+        write_error_log(str(e))
+        log(f'Error occurred: {e}', write_to_file=True, level=LOG_ERROR)
+        try:
+            METRICS.measure('leds', show_stored_forecast)
+        except Exception as e:
+            log(f'  >> Failed to draw the stored forecast. Error: {type(e).__name__} {e}')
+        METRICS.stop('cycle', cycle, ok=False)
+        METRICS.flush()
+
+def main():
+    print('Starting up....')
+    state = restore_sleep_state()
+    if state is None:
+        init_neopixel()
+        if not show_last_frame():
+            set_LEDs(color='cyan', brightness=10)
+        SCHEDULER.run()
+    else:
+        SCHEDULER.run(state['then'])
@@ -0,0 +1,167 @@
+import core
+
+class JSON_extractor():
+    # Incremental JSON scanner. Chunks are pushed in with feed(); every object directly inside the
+    # array named array_key (or inside the top level array when array_key is None) is a record,
+    # and only the relative paths listed in fields (b'a.b' -> name) are kept from it. on_record
+    # returns True once it has everything it needs, which stops the scan.
+    def __init__(self, array_key, fields, on_record):
+        self.array_key = array_key
+        self.fields = fields
+        self.max_depth = max([path.count(b'.') for path in fields])
+        self.on_record = on_record
+        self.keys = []
+        self.arrays = []
+        self.key = None
+        self.expect_key = False
+        self.record = None
+        self.record_depth = 0
+        self.tail = b''
+        self.stopped = False
+        self.bytes_read = 0
+    def feed(self, data):
+        self.bytes_read += len(data)
+        buf = self.tail + data if self.tail else data
+        end = len(buf)
+        i = 0
+        while i < end and not self.stopped:
+            c = buf[i]
+            if c in b' \t\r\n:':
+                i += 1
+            elif c == 0x22:
+                j = self.find_string_end(buf, i + 1)
+                if j == -1:
+                    break
+                self.value(buf[i+1:j], True)
+                i = j + 1
+            elif c == 0x7b or c == 0x5b:
+                self.open(c == 0x5b)
+                i += 1
+            elif c == 0x7d or c == 0x5d:
+                self.close()
+                i += 1
+            elif c == 0x2c:
+                self.key = None
+                self.expect_key = not self.arrays[-1]
+                i += 1
+            else:
+                j = i + 1
+                while j < end and buf[j] not in b',}] \t\r\n':
+                    j += 1
+                if j == end:
+                    break
+                self.value(buf[i:j], False)
+                i = j
+        self.tail = buf[i:] if i < end else b''
+    def find_string_end(self, buf, start):
+        j = buf.find(b'"', start)
+        while j != -1:
+            k = j - 1
+            while k >= start and buf[k] == 0x5c:
+                k -= 1
+            if (j - 1 - k) % 2 == 0:
+                return j
+            j = buf.find(b'"', j + 1)
+        return -1
+    def open(self, is_array):
+        self.keys.append(self.key)
+        self.arrays.append(is_array)
+        if not is_array and self.record is None and len(self.keys) > 1 and self.arrays[-2]:
+            if self.array_key is None:
+                is_record = len(self.keys) == 2
+            else:
+                is_record = self.keys[-2] == self.array_key
+            if is_record:
+                self.record = {}
+                self.record_depth = len(self.keys)
+        self.key = None
+        self.expect_key = not is_array
+    def close(self):
+        if self.record is not None and len(self.keys) == self.record_depth:
+            record = self.record
+            self.record = None
+            if self.on_record(record):
+                self.stopped = True
+        self.keys.pop()
+        self.arrays.pop()
+        self.key = None
+        self.expect_key = False
+    def value(self, raw, is_string):
+        if self.expect_key:
+            self.key = raw
+            self.expect_key = False
+            return
+        if self.record is None or self.key is None:
+            return
+        depth = len(self.keys) - self.record_depth
+        if depth > self.max_depth:
+            return
+        path = self.key if depth == 0 else b'.'.join(self.keys[self.record_depth:] + [self.key])
+        name = self.fields.get(path)
+        if name is None:
+            return
+        if is_string:
+            self.record[name] = str(raw, 'utf-8')
+        else:
+            self.record[name] = parse_json_scalar(raw)
+
+class Hour_collector():
+    # Fills a core.Forecast starting at local midnight from streamed forecast records and asks the
+    # stream to stop as soon as every hour shown on the LEDs has data. Hours already past today
+    # can also be filled by the same hour tomorrow.
+    def __init__(self, time_field, rain_field, temp_field=None, feels_field=None):
+        self.fields = {time_field.encode(): 'time', rain_field.encode(): 'rain'}
+        if temp_field is not None:
+            self.fields[temp_field.encode()] = 'temp'
+        if feels_field is not None:
+            self.fields[feels_field.encode()] = 'feels'
+        self.midnight = core.FORECAST_STORE.get_midnight()
+        self.forecast = core.Forecast(self.midnight)
+        self.pending = set(core.get_led_window_hours())
+        self.last = max([hour if hour >= core.HOUR else hour + 24 for hour in self.pending])
+    def add(self, record):
+        stamp = record.get('time')
+        if stamp is None:
+            return False
+        epoch = core.get_epoch_from_stamp(stamp)
+        hour = (epoch - self.midnight) // 3600
+        if hour > self.last:
+            core.log(f'    >> Data from time {stamp} is past the last hour shown, stopping')
+            return True
+        self.forecast.set(epoch, record)
+        self.pending.discard(hour)
+        if hour - 24 < core.HOUR:
+            self.pending.discard(hour - 24)
+        return not self.pending
+    async def collect(self, response, array_key):
+        extractor = JSON_extractor(array_key, self.fields, self.add)
+        await core.METRICS.measure_async('parse', stream_json(response, extractor))
+        return self.forecast
+
+def parse_json_scalar(raw):
+    if raw == b'null':
+        return None
+    if raw == b'true':
+        return True
+    if raw == b'false':
+        return False
+    text = str(raw, 'utf-8')
+    if '.' in text or 'e' in text or 'E' in text:
+        return float(text)
+    return int(text)
+
+async def stream_json(response, extractor):
+    try:
+        if response.status_code != 200:
+            raise ValueError(f'Request failed with status {response.status_code}')
+        while not extractor.stopped:
+            chunk = await response.read(core.STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            extractor.feed(chunk)
+    finally:
+        response.close()
+    if extractor.stopped:
+        core.log(f'    >> Read {extractor.bytes_read} bytes, stopped once everything needed was found')
+    else:
+        core.log(f'    >> Read {extractor.bytes_read} bytes')
@@ -0,0 +1,41 @@
+import core
+from json_stream import Hour_collector
+
+class Accuweather():
+    def __init__(self):
+        self.api_key = core.CONFIG['ACCUWEATHER_API_KEY']
+    async def get_location_key(self):
+        key = core.LOCATION_CACHE.get('accuweather')
+        if key is not None:
+            core.log('Using cached Accuweather location key')
+            return key
+        core.log('Getting Accuweather location key')
+        url = 'http://dataservice.accuweather.com/locations/v1/cities/geoposition/search?'
+        url = url + '&apikey=' + self.api_key
+        url = url + '&q=' + core.CONFIG['LOCATION']['LATITUDE'] + '%2C' + core.CONFIG['LOCATION']['LONGITUDE']
+        response = await (await core.HTTP.get(url)).json()
+        key = str(response['Key'])
+        core.LOCATION_CACHE.set('accuweather', key)
+        return key
+    async def get_data(self, location_key):
+        core.log('Getting Weather Data')
+        url = 'http://dataservice.accuweather.com/forecasts/v1/hourly/12hour/' + location_key + '?'
+        url = url + '&apikey=' + core.CONFIG['ACCUWEATHER_API_KEY']
+        if 'feels' in core.DISPLAY_METRICS:
+            # RealFeel is only in the detailed response
+            url = url + '&details=true'
+        return await core.HTTP.get(url)
+    async def extract_precip_chance(self, response):
+        core.log('Extracting precip chance from response')
+        hours = await Hour_collector('DateTime', 'PrecipitationProbability', 'Temperature.Value', 'RealFeelTemperature.Value').collect(response, None)
+        core.log(f'Returned {hours.count()} hours')
+        return hours
+    async def main(self):
+        response = await self.get_data(await self.get_location_key())
+        if response.status_code in core.INVALIDATING_STATUS:
+            core.log(f'  >> Location key was rejected with status {response.status_code}, resolving it again')
+            response.close()
+            core.LOCATION_CACHE.invalidate('accuweather')
+            response = await self.get_data(await self.get_location_key())
+        hourMap = await self.extract_precip_chance(response)
+        return hourMap
@@ -0,0 +1,49 @@
+import os
+import struct
+import time
+import core
+
+class Gateway():
+    # Reads the forecast a LAN gateway (tools/gateway.py) already fetched for this location. The frame
+    # is GATEWAY_HEADER (magic, version, local hour, day, hours, UTC offset, fetched, start) followed
+    # by `hours` values of each of FORECAST_METRICS. Its ETag is sent back on the next fetch, so an
+    # unchanged forecast costs one 304 and the stored forecast is kept.
+    def __init__(self):
+        self.url = core.CONFIG['GATEWAY_URL']
+        # Frames carry Unix times, while most boards count from 2000
+        self.epoch_offset = 946684800 if time.localtime(0)[0] == 2000 else 0
+    async def get_frame(self):
+        core.log('Getting forecast frame from the gateway')
+        headers = {}
+        core.FORECAST_STORE.load()
+        if core.FORECAST_STORE.forecast is not None and core.GATEWAY_ETAG_FILE in os.listdir():
+            with open(core.GATEWAY_ETAG_FILE, 'r') as f:
+                headers['If-None-Match'] = f.read()
+        return await core.HTTP.get(self.url, headers)
+    def parse_frame(self, frame):
+        magic, version, hour, day, hours, offset, fetched, start = struct.unpack_from(core.GATEWAY_HEADER, frame)
+        if magic != core.GATEWAY_MAGIC or version != 1 or hours > core.FORECAST_HOURS:
+            raise ValueError('Not a version 1 gateway frame')
+        core.log(f'  >> Frame of {hours} hours fetched by the gateway at local hour {hour}, day {day}')
+        forecast = core.Forecast(start - self.epoch_offset)
+        position = struct.calcsize(core.GATEWAY_HEADER)
+        for metric in core.FORECAST_METRICS:
+            layout = '<' + str(hours) + core.FORECAST_TYPECODES[metric]
+            values = forecast.values[metric]
+            for index, value in enumerate(struct.unpack_from(layout, frame, position)):
+                values[index] = value
+            position = position + struct.calcsize(layout)
+        return forecast
+    async def main(self):
+        response = await self.get_frame()
+        if response.status_code == 304:
+            response.close()
+            core.log('  >> Frame unchanged, keeping the stored forecast')
+            return core.FORECAST_STORE.forecast
+        etag = response.headers.get('etag')
+        forecast = self.parse_frame(await response.read_all())
+        if etag is not None:
+            with open(core.GATEWAY_ETAG_FILE, 'w') as f:
+                f.write(etag)
+        core.log(f'Returned {forecast.count()} hours')
+        return forecast
@@ -0,0 +1,22 @@
+import core
+from json_stream import Hour_collector
+
+class WeatherAPI():
+    def __init__(self):
+        self.api_key = core.CONFIG['WEATHERAPI_API_KEY']
+    async def get_forecast(self):
+        core.log('Getting Weather Data from weatherapi')
+        url = "http://api.weatherapi.com/v1/forecast.json"
+        url = url + "?key=" + self.api_key + "&q=" + core.CONFIG['LOCATION']['LATITUDE'] + "," + core.CONFIG['LOCATION']['LONGITUDE']
+        days = (core.CONFIG['LED']['FIRST_BAR_HOUR'] + core.WINDOW_HOURS - 1) // 24 + 1
+        url = url + "&days=" + str(days) + "&aqi=no" + "&alerts=no" + "&hour_fields=chance_of_rain,will_it_rain,feelslike_f"
+        return await core.HTTP.get(url)
+    async def map_hours_data(self, forecast):
+        core.log('Mapping weatherapi hour data')
+        hours = await Hour_collector('time', 'chance_of_rain', 'temp_f', 'feelslike_f').collect(forecast, b'hour')
+        core.log(f'Returned {hours.count()} hours')
+        return hours
+    async def main(self):
+        forecast = await self.get_forecast()
+        hourMap = await self.map_hours_data(forecast)
+        return hourMap
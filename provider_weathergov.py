@@ -0,0 +1,39 @@
+import core
+from json_stream import Hour_collector
+
+class WeatherGOV():
+    def __init__(self):
+        core.log('Getting Weather Data from weather.gov')
+        self.base = 'https://api.weather.gov'
+        self.latitude = str(round(float(core.CONFIG['LOCATION']['LATITUDE']), 4))
+        self.longitude = str(round(float(core.CONFIG['LOCATION']['LONGITUDE']), 4))
+        self.headers = {'user-agent':'unpadded_viselike357@simplelogin.com'}
+    async def get_point(self):
+        core.log('  >> Getting point data/endpoint by geo coords')
+        url = self.base + '/points/' + self.latitude + ',' + self.longitude
+        point = await (await core.HTTP.get(url, self.headers)).json()
+        forecast_endpoint = point['properties']['forecastHourly']
+        core.LOCATION_CACHE.set('weathergov', forecast_endpoint)
+        return forecast_endpoint
+    async def get_forecast(self, endpoint):
+        core.log('  >> Getting forecast data from endpoint')
+        return await core.HTTP.get(endpoint, self.headers)
+    async def filter_forecast(self, forecast):
+        core.log('  >> Filtering forecast data')
+        collector = Hour_collector('startTime', 'probabilityOfPrecipitation.value', 'temperature')
+        return await collector.collect(forecast, b'periods')
+    async def main(self):
+        forecast = None
+        endpoint = core.LOCATION_CACHE.get('weathergov')
+        if endpoint is not None:
+            core.log('  >> Using cached forecast endpoint')
+            forecast = await self.get_forecast(endpoint)
+            if forecast.status_code in core.INVALIDATING_STATUS:
+                core.log(f'  >> Cached endpoint returned status {forecast.status_code}, resolving it again')
+                forecast.close()
+                core.LOCATION_CACHE.invalidate('weathergov')
+                forecast = None
+        if forecast is None:
+            forecast = await self.get_forecast(await self.get_point())
+        filtered = await self.filter_forecast(forecast)
+        return filtered   
@@ -0,0 +1,198 @@
+import asyncio
+import asyncio.selector_events
+import selectors
+import types
+
+from simulator import urequests
+from simulator.fixtures import SIM_TIME_HEADER
+
+# Seconds of real time to wait for the fixture server before treating a wait as idle time: the
+# full wait while a response is outstanding, a short one while other sockets are open, since an
+# idle keep-alive connection stays registered with the selector
+REAL_IO_WAIT = 5.0
+REAL_IO_SETTLE = 0.02
+# Socket reads and stream buffers sized like lwIP's rather than CPython's 256KB reads, which
+# would otherwise dominate the measured peak allocation
+SOCKET_READ_BYTES = 1460
+STREAM_BUFFER_BYTES = 4096
+
+
+class Virtual_selector():
+    # While sockets to the fixture server are in flight the loop waits for them in real time.
+    # Otherwise nothing can happen before the next timer, so the virtual clock jumps straight to it.
+    def __init__(self, clock, device=None):
+        self.clock = clock
+        self.device = device
+        self.real = selectors.DefaultSelector()
+        self.ignored = set()
+
+    def register(self, fileobj, events, data=None):
+        return self.real.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.real.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.real.modify(fileobj, events, data)
+
+    def get_key(self, fileobj):
+        return self.real.get_key(fileobj)
+
+    def get_map(self):
+        return self.real.get_map()
+
+    def close(self):
+        self.real.close()
+
+    def select(self, timeout=None):
+        events = self.real.select(0)
+        if events or timeout == 0:
+            return events
+        in_flight = [key for key in self.real.get_map().values() if key.fd not in self.ignored]
+        if in_flight or timeout is None:
+            wait = None
+            if in_flight:
+                awaiting = self.device is None or self.device.awaiting_responses > 0
+                wait = REAL_IO_WAIT if awaiting or timeout is None else REAL_IO_SETTLE
+            events = self.real.select(wait)
+            if events or timeout is None:
+                return events
+        self.clock.advance(timeout)
+        return []
+
+
+class Virtual_loop(asyncio.SelectorEventLoop):
+    def __init__(self, clock, device=None):
+        asyncio.selector_events._SelectorSocketTransport.max_size = SOCKET_READ_BYTES
+        selector = Virtual_selector(clock, device)
+        asyncio.SelectorEventLoop.__init__(self, selector)
+        selector.ignored.add(self._ssock.fileno())
+        self.clock = clock
+        # Unix times are floats with ~0.2us steps, so timers within a millisecond count as due
+        self._clock_resolution = 0.001
+
+    def time(self):
+        return self.clock.true
+
+
+class Sim_reader():
+    def __init__(self, device, reader):
+        self.device = device
+        self.reader = reader
+        self.requests_sent = 0
+
+    async def charge(self, data):
+        # The first read after each request waits out the server's time to first byte
+        if self.requests_sent:
+            self.device.awaiting_responses = self.device.awaiting_responses - self.requests_sent
+            self.requests_sent = 0
+            await asyncio.sleep(urequests.FIRST_BYTE_MS / 1000.0)
+        self.device.counters.bytes_read = self.device.counters.bytes_read + len(data)
+        if data:
+            await asyncio.sleep(len(data) / urequests.DOWNLOAD_BYTES_PER_SECOND)
+        return data
+
+    async def read(self, size=-1):
+        return await self.charge(await self.reader.read(size))
+
+    async def readline(self):
+        return await self.charge(await self.reader.readline())
+
+    async def readexactly(self, size):
+        return await self.charge(await self.reader.readexactly(size))
+
+    async def readinto(self, buf):
+        data = await self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+class Sim_writer():
+    # Adds the simulated time to each request's headers for the fixture server and counts requests
+    def __init__(self, device, writer, reader):
+        self.device = device
+        self.writer = writer
+        self.reader = reader
+        self.pending = b''
+
+    def write(self, data):
+        self.pending = self.pending + bytes(data)
+        while b'\r\n\r\n' in self.pending:
+            head, _, self.pending = self.pending.partition(b'\r\n\r\n')
+            self.device.counters.requests = self.device.counters.requests + 1
+            self.reader.requests_sent = self.reader.requests_sent + 1
+            self.device.awaiting_responses = self.device.awaiting_responses + 1
+            stamp = (SIM_TIME_HEADER + ': ' + repr(self.device.clock.true)).encode()
+            self.writer.write(head + b'\r\n' + stamp + b'\r\n\r\n')
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        # A connection dropped before its response arrived is no longer waited on
+        self.device.awaiting_responses = self.device.awaiting_responses - self.reader.requests_sent
+        self.reader.requests_sent = 0
+        self.writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    def get_extra_info(self, name, default=None):
+        return self.writer.get_extra_info(name, default)
+
+
+def make_module(device):
+    # The real asyncio with a virtual clock loop, and open_connection pointed at the fixture server
+    async def open_connection(host, port, ssl=None, server_hostname=None):
+        if not device.network_up():
+            await asyncio.sleep(urequests.DNS_MS / 1000.0)
+            raise OSError(-202)
+        remaining = device.failures.get(host, 0)
+        if remaining:
+            device.failures[host] = remaining - 1
+            await asyncio.sleep((urequests.DNS_MS + urequests.CONNECT_MS) / 1000.0)
+            raise OSError(104)
+        device.counters.connections = device.counters.connections + 1
+        latency = urequests.DNS_MS + urequests.CONNECT_MS + device.extra_latency.get(host, 0)
+        if ssl:
+            latency = latency + urequests.TLS_HANDSHAKE_MS
+        await asyncio.sleep(latency / 1000.0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', device.fixture_port, limit=STREAM_BUFFER_BYTES)
+        reader = Sim_reader(device, reader)
+        return reader, Sim_writer(device, writer, reader)
+
+    def run(coro):
+        with asyncio.Runner(loop_factory=lambda: Virtual_loop(device.clock, device)) as runner:
+            return runner.run(coro)
+
+    fake = types.ModuleType('asyncio')
+    for name in dir(asyncio):
+        if not name.startswith('__'):
+            setattr(fake, name, getattr(asyncio, name))
+    fake.open_connection = open_connection
+    fake.run = run
+    fake.sleep_ms = lambda ms: asyncio.sleep(ms / 1000.0)
+    return fake
+
+
+def make_ssl_module():
+    # Contexts are accepted and ignored; the fixture server only speaks plain HTTP
+    class SSLContext():
+        def __init__(self, protocol=None):
+            self.protocol = protocol
+            self.verify_mode = 0
+
+        def load_verify_locations(self, *args, **kwargs):
+            pass
+
+    fake = types.ModuleType('ssl')
+    fake.SSLContext = SSLContext
+    fake.PROTOCOL_TLS_CLIENT = 0
+    fake.PROTOCOL_TLS_SERVER = 1
+    fake.CERT_NONE = 0
+    fake.CERT_OPTIONAL = 1
+    fake.CERT_REQUIRED = 2
+    return fake
@@ -0,0 +1,56 @@
+import calendar
+import time
+
+UNSYNCED_RTC_EPOCH = 946684800  # 2000-01-01, where an ESP32 RTC starts after power on
+TICKS_MASK = (1 << 30) - 1
+TICKS_HALF = 1 << 29
+
+
+class Clock():
+    # `true` is real world unix time in the simulation. It only moves when the firmware sleeps or
+    # a simulated operation (wifi join, request, LED write) charges its latency, so runs are
+    # repeatable. The device RTC is `true` plus an offset and drifts `drift_ppm` until the next
+    # NTP sync.
+    def __init__(self, start, drift_ppm=0.0):
+        self.true = float(start)
+        self.drift_ppm = drift_ppm
+        self.offset = UNSYNCED_RTC_EPOCH - self.true
+        self.synced_at = self.true
+
+    def advance(self, seconds):
+        if seconds > 0:
+            self.true = self.true + seconds
+
+    def advance_ms(self, ms):
+        self.advance(ms / 1000.0)
+
+    def device_time(self):
+        return self.true + self.offset + (self.true - self.synced_at) * self.drift_ppm / 1e6
+
+    def set_device_time(self, seconds):
+        self.offset = seconds - self.true
+        self.synced_at = self.true
+
+    def sync(self):
+        self.set_device_time(self.true)
+
+    def ticks_ms(self):
+        return int(self.true * 1000) & TICKS_MASK
+
+
+def gmtime_tuple(seconds):
+    now = time.gmtime(int(seconds))
+    return (now.tm_year, now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min, now.tm_sec, now.tm_wday, now.tm_yday)
+
+
+def mktime_tuple(stamp):
+    # MicroPython normalizes out of range fields (day 35 of a month) like calendar.timegm does
+    return calendar.timegm(tuple(stamp[:6]))
+
+
+def ticks_diff(end, start):
+    return ((end - start + TICKS_HALF) & TICKS_MASK) - TICKS_HALF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & TICKS_MASK
@@ -0,0 +1,368 @@
+import gc as host_gc
+import random as host_random
+import tracemalloc
+import types
+
+from simulator import aio
+from simulator import clock as clock_module
+from simulator import urequests
+
+# Latencies charged to the virtual clock, in milliseconds. They are rough ESP32-S3 figures and
+# only need to be stable between runs, not exact.
+WIFI_ACTIVATE_MS = 120
+WIFI_SCAN_MS = 2200
+WIFI_FAST_JOIN_MS = 700
+WIFI_JOIN_MS = 2400
+WIFI_DHCP_MS = 650
+NTP_MS = 60
+NTP_HOST = 'pool.ntp.org'
+NTP_TIMEOUT_MS = 1000
+LED_BIT_US = 1.25
+HEAP_BYTES = 262144
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+
+class SimulatedReset(BaseException):
+    # BaseException so the firmware's own `except Exception` handlers cannot swallow it
+    pass
+
+
+class SimulatedDeepSleep(BaseException):
+    def __init__(self, ms):
+        BaseException.__init__(self, ms)
+        self.ms = ms
+
+
+class Counters():
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.bytes_read = 0
+        self.bytes_offered = 0
+        self.neopixel_writes = 0
+
+    def snapshot(self):
+        return (self.requests, self.connections, self.bytes_read, self.bytes_offered, self.neopixel_writes)
+
+
+class Access_point():
+    def __init__(self, ssid, bssid=b'\x24\x0a\xc4\x12\x34\x56', channel=6, rssi=-58):
+        self.ssid = ssid
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+
+
+class Device():
+    # State that survives a reset or deep sleep of the simulated board (RTC, RTC memory, flash,
+    # the access point it joins) plus the fake modules handed to each fresh boot of the firmware.
+    def __init__(self, clock, fixture_port, ssid, failures=None, extra_latency=None):
+        self.clock = clock
+        self.fixture_port = fixture_port
+        self.access_point = Access_point(ssid)
+        self.failures = dict(failures or {})
+        self.extra_latency = dict(extra_latency or {})
+        self.rtc_memory = b''
+        self.reset_cause = PWRON_RESET
+        self.counters = Counters()
+        self.wifi_connected_at = None
+        self.dhcp_done_at = None
+        self.heap_baseline = 0
+        self.awaiting_responses = 0
+        self.first_write_at = None
+
+    def network_up(self):
+        return self.dhcp_done_at is not None and self.clock.true >= self.dhcp_done_at
+
+    def mark_heap(self):
+        # Called once the firmware is loaded; its code objects are far larger under CPython than
+        # the bytecode on the board, so heap use is counted from here
+        if tracemalloc.is_tracing():
+            self.heap_baseline = tracemalloc.get_traced_memory()[0]
+
+    def modules(self):
+        return {
+            'time': make_time(self),
+            'utime': make_time(self),
+            'machine': make_machine(self),
+            'network': make_network(self),
+            'ntptime': make_ntptime(self),
+            'neopixel': make_neopixel(self),
+            'micropython': make_micropython(),
+            'gc': make_gc(self),
+            'random': make_random(),
+            'asyncio': aio.make_module(self),
+            'uasyncio': aio.make_module(self),
+            'ssl': aio.make_ssl_module(),
+            'urequests': urequests.make_module(self),
+            'requests': urequests.make_module(self),
+        }
+
+
+def module(name, **members):
+    fake = types.ModuleType(name)
+    fake.__dict__.update(members)
+    return fake
+
+
+def make_time(device):
+    clock = device.clock
+
+    def time_now():
+        return int(clock.device_time())
+
+    def localtime(seconds=None):
+        return clock_module.gmtime_tuple(clock.device_time() if seconds is None else seconds)
+
+    def sleep(seconds):
+        clock.advance(seconds)
+
+    def sleep_ms(ms):
+        clock.advance_ms(ms)
+
+    def sleep_us(us):
+        clock.advance(us / 1e6)
+
+    return module(
+        'time',
+        time=time_now,
+        time_ns=lambda: int(clock.device_time() * 1e9),
+        localtime=localtime,
+        gmtime=localtime,
+        mktime=clock_module.mktime_tuple,
+        sleep=sleep,
+        sleep_ms=sleep_ms,
+        sleep_us=sleep_us,
+        ticks_ms=clock.ticks_ms,
+        ticks_us=lambda: int(clock.true * 1e6) & clock_module.TICKS_MASK,
+        ticks_diff=clock_module.ticks_diff,
+        ticks_add=clock_module.ticks_add,
+    )
+
+
+def make_machine(device):
+    class Pin():
+        IN = 1
+        OUT = 3
+        PULL_UP = 1
+        PULL_DOWN = 2
+
+        def __init__(self, pin, mode=-1, pull=-1, value=None, hold=False):
+            self.pin = pin
+            self.level = value or 0
+
+        def value(self, level=None):
+            if level is None:
+                return self.level
+            self.level = level
+
+        def on(self):
+            self.level = 1
+
+        def off(self):
+            self.level = 0
+
+    class RTC():
+        def datetime(self, stamp=None):
+            if stamp is None:
+                now = clock_module.gmtime_tuple(device.clock.device_time())
+                return (now[0], now[1], now[2], now[6], now[3], now[4], now[5], 0)
+            device.clock.set_device_time(clock_module.mktime_tuple((stamp[0], stamp[1], stamp[2], stamp[4], stamp[5], stamp[6])))
+
+        def memory(self, data=None):
+            if data is None:
+                return device.rtc_memory
+            if len(data) > 2048:
+                raise ValueError('RTC memory is limited to 2048 bytes')
+            device.rtc_memory = bytes(data)
+
+    def deepsleep(ms=0):
+        raise SimulatedDeepSleep(ms)
+
+    def reset():
+        raise SimulatedReset()
+
+    return module(
+        'machine',
+        Pin=Pin,
+        RTC=RTC,
+        deepsleep=deepsleep,
+        lightsleep=lambda ms=0: device.clock.advance_ms(ms),
+        reset=reset,
+        soft_reset=reset,
+        reset_cause=lambda: device.reset_cause,
+        freq=lambda hz=None: 240000000,
+        unique_id=lambda: b'\x24\x0a\xc4\x00\x00\x01',
+        PWRON_RESET=PWRON_RESET,
+        HARD_RESET=HARD_RESET,
+        WDT_RESET=WDT_RESET,
+        DEEPSLEEP_RESET=DEEPSLEEP_RESET,
+        SOFT_RESET=SOFT_RESET,
+    )
+
+
+def make_network(device):
+    clock = device.clock
+
+    class WLAN():
+        def __init__(self, interface=0):
+            self.is_active = False
+            self.static = None
+            self.channel = None
+            device.wifi_connected_at = None
+            device.dhcp_done_at = None
+
+        def active(self, state=None):
+            if state is None:
+                return self.is_active
+            if state and not self.is_active:
+                clock.advance_ms(WIFI_ACTIVATE_MS)
+            self.is_active = bool(state)
+            if not state:
+                self.disconnect()
+
+        def scan(self):
+            if not self.is_active:
+                raise OSError('Wifi Not Started')
+            clock.advance_ms(WIFI_SCAN_MS)
+            point = device.access_point
+            return [
+                (point.ssid.encode(), point.bssid, point.channel, point.rssi, 3, False),
+                (b'neighbour', b'\x24\x0a\xc4\x65\x43\x21', 11, -81, 3, False),
+            ]
+
+        def connect(self, ssid=None, key=None, bssid=None):
+            if not self.is_active:
+                raise OSError('Wifi Not Started')
+            if ssid != device.access_point.ssid:
+                return
+            fast = bssid == device.access_point.bssid and self.channel == device.access_point.channel
+            if bssid is not None and bssid != device.access_point.bssid:
+                return
+            device.wifi_connected_at = clock.true + (WIFI_FAST_JOIN_MS if fast else WIFI_JOIN_MS) / 1000.0
+            dhcp = 0 if self.static is not None else WIFI_DHCP_MS
+            device.dhcp_done_at = device.wifi_connected_at + dhcp / 1000.0
+
+        def disconnect(self):
+            device.wifi_connected_at = None
+            device.dhcp_done_at = None
+
+        def isconnected(self):
+            return device.wifi_connected_at is not None and clock.true >= device.wifi_connected_at
+
+        def ifconfig(self, config=None):
+            if config is not None:
+                self.static = tuple(config)
+                return
+            if not device.network_up():
+                return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+            return self.static or ('192.168.1.42', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+
+        def config(self, *args, **kwargs):
+            if 'channel' in kwargs:
+                self.channel = kwargs['channel']
+            if args == ('mac',):
+                return b'\x24\x0a\xc4\x00\x00\x01'
+
+        def status(self, *args):
+            return 1010 if self.isconnected() else 1000
+
+    return module('network', WLAN=WLAN, STA_IF=0, AP_IF=1)
+
+
+def make_ntptime(device):
+    def settime():
+        if not device.network_up():
+            raise OSError(-202)
+        # --fail pool.ntp.org=N times out the next N syncs
+        remaining = device.failures.get(NTP_HOST, 0)
+        if remaining:
+            device.failures[NTP_HOST] = remaining - 1
+            device.clock.advance_ms(NTP_TIMEOUT_MS)
+            raise OSError(110)
+        device.clock.advance_ms(NTP_MS)
+        device.counters.requests = device.counters.requests + 1
+        device.clock.sync()
+
+    def ntp_time():
+        settime()
+        return int(device.clock.device_time())
+
+    return module('ntptime', settime=settime, time=ntp_time, host=NTP_HOST, timeout=NTP_TIMEOUT_MS // 1000)
+
+
+def make_neopixel(device):
+    class NeoPixel():
+        ORDER = (1, 0, 2, 3)
+
+        def __init__(self, pin, n, bpp=3, timing=1):
+            self.pin = pin
+            self.n = n
+            self.bpp = bpp
+            self.buf = bytearray(n * bpp)
+
+        def __len__(self):
+            return self.n
+
+        def __setitem__(self, index, value):
+            offset = index * self.bpp
+            for channel in range(self.bpp):
+                self.buf[offset + self.ORDER[channel]] = value[channel]
+
+        def __getitem__(self, index):
+            offset = index * self.bpp
+            return tuple(self.buf[offset + self.ORDER[channel]] for channel in range(self.bpp))
+
+        def fill(self, value):
+            for index in range(self.n):
+                self[index] = value
+
+        def write(self):
+            device.clock.advance(len(self.buf) * 8 * LED_BIT_US / 1e6)
+            device.counters.neopixel_writes = device.counters.neopixel_writes + 1
+            if device.first_write_at is None:
+                device.first_write_at = device.clock.true
+
+    return module('neopixel', NeoPixel=NeoPixel)
+
+
+def make_micropython():
+    return module('micropython', const=lambda value: value, native=lambda f: f, viper=lambda f: f)
+
+
+def make_random():
+    # Seeded so retry jitter, and with it the virtual timings, repeat from run to run
+    generator = host_random.Random(0)
+    return module(
+        'random',
+        getrandbits=generator.getrandbits,
+        randint=generator.randint,
+        random=generator.random,
+        uniform=generator.uniform,
+        choice=generator.choice,
+        seed=generator.seed,
+    )
+
+
+def make_gc(device):
+    # Heap figures are what tracemalloc has seen allocated since boot, against a nominal heap
+    def mem_alloc():
+        if tracemalloc.is_tracing():
+            return max(0, tracemalloc.get_traced_memory()[0] - device.heap_baseline)
+        return 0
+
+    return module(
+        'gc',
+        collect=host_gc.collect,
+        enable=host_gc.enable,
+        disable=host_gc.disable,
+        isenabled=host_gc.isenabled,
+        mem_alloc=mem_alloc,
+        mem_free=lambda: max(0, HEAP_BYTES - mem_alloc()),
+        threshold=lambda amount=None: -1,
+    )
@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo
+
+# Responses are generated in the shape and at the size of recorded provider responses (pretty
+# printed weather.gov GeoJSON with ~156 periods, a one day WeatherAPI forecast, AccuWeather's 12
+# hour list). Values are deterministic for a given hour so runs are comparable.
+
+REPO = 'jhaugh0/Rain-Chance-Monitor'
+TIME_REGION = 'America/New_York'
+GRID_PATH = '/gridpoints/OKX/33,35/forecast/hourly'
+ACCUWEATHER_KEY = '349727'
+SIM_TIME_HEADER = 'X-Sim-Time'
+
+
+def firmware_files(firmware_dir):
+    # Every top level .py file is firmware, the same rule the OTA updater applies to a release
+    return sorted(name for name in os.listdir(firmware_dir) if name.endswith('.py'))
+
+
+def rain_chance(stamp):
+    hours = int(stamp.timestamp() // 3600)
+    return int(50 + 45 * math.sin(hours / 5.0)) // 5 * 5
+
+
+def temperature(stamp):
+    hours = int(stamp.timestamp() // 3600)
+    return int(62 + 14 * math.sin((stamp.hour - 9) / 24.0 * 2 * math.pi) + 3 * math.sin(hours / 37.0))
+
+
+def local_hour(epoch):
+    stamp = datetime.fromtimestamp(epoch, ZoneInfo(TIME_REGION))
+    return stamp.replace(minute=0, second=0, microsecond=0)
+
+
+def weathergov_points(epoch):
+    properties = {
+        '@id': 'https://api.weather.gov/points/40.7128,-74.006',
+        '@type': 'wx:Point',
+        'cwa': 'OKX',
+        'forecastOffice': 'https://api.weather.gov/offices/OKX',
+        'gridId': 'OKX',
+        'gridX': 33,
+        'gridY': 35,
+        'forecast': 'https://api.weather.gov/gridpoints/OKX/33,35/forecast',
+        'forecastHourly': 'https://api.weather.gov' + GRID_PATH,
+        'forecastGridData': 'https://api.weather.gov/gridpoints/OKX/33,35',
+        'observationStations': 'https://api.weather.gov/gridpoints/OKX/33,35/stations',
+        'relativeLocation': {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [-74.0279259, 40.7158]},
+            'properties': {
+                'city': 'Hoboken',
+                'state': 'NJ',
+                'distance': {'unitCode': 'wmoUnit:m', 'value': 1824.58},
+                'bearing': {'unitCode': 'wmoUnit:degree_(angle)', 'value': 102},
+            },
+        },
+        'forecastZone': 'https://api.weather.gov/zones/forecast/NYZ072',
+        'county': 'https://api.weather.gov/zones/county/NYC061',
+        'fireWeatherZone': 'https://api.weather.gov/zones/fire/NYZ212',
+        'timeZone': TIME_REGION,
+        'radarStation': 'KDIX',
+    }
+    return {
+        '@context': ['https://geojson.org/geojson-ld/geojson-context.jsonld', {'@version': '1.1', 'wx': 'https://api.weather.gov/ontology#'}],
+        'id': 'https://api.weather.gov/points/40.7128,-74.006',
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [-74.006, 40.7128]},
+        'properties': properties,
+    }
+
+
+def weathergov_hourly(epoch):
+    start = local_hour(epoch)
+    periods = []
+    for number in range(156):
+        stamp = start + timedelta(hours=number)
+        rain = rain_chance(stamp)
+        periods.append({
+            'number': number + 1,
+            'name': '',
+            'startTime': stamp.isoformat(),
+            'endTime': (stamp + timedelta(hours=1)).isoformat(),
+            'isDaytime': 6 <= stamp.hour < 18,
+            'temperature': temperature(stamp),
+            'temperatureUnit': 'F',
+            'temperatureTrend': '',
+            'probabilityOfPrecipitation': {'unitCode': 'wmoUnit:percent', 'value': rain},
+            'dewpoint': {'unitCode': 'wmoUnit:degC', 'value': 11.666666666666666},
+            'relativeHumidity': {'unitCode': 'wmoUnit:percent', 'value': 68},
+            'windSpeed': '8 mph',
+            'windDirection': 'SW',
+            'icon': 'https://api.weather.gov/icons/land/day/rain_showers,%d?size=small' % rain,
+            'shortForecast': 'Chance Rain Showers' if rain >= 30 else 'Partly Cloudy',
+            'detailedForecast': '',
+        })
+    generated = datetime.fromtimestamp(epoch, timezone.utc).replace(microsecond=0).isoformat()
+    return {
+        '@context': ['https://geojson.org/geojson-ld/geojson-context.jsonld', {'@version': '1.1', 'wx': 'https://api.weather.gov/ontology#', 'geo': 'http://www.opengis.net/ont/geosparql#', 'unit': 'http://codes.wmo.int/common/unit/', '@vocab': 'https://api.weather.gov/ontology#'}],
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [[[-74.0247, 40.7241], [-74.0283, 40.7020], [-73.9992, 40.6993], [-73.9956, 40.7214], [-74.0247, 40.7241]]]},
+        'properties': {
+            'units': 'us',
+            'forecastGenerator': 'HourlyForecastGenerator',
+            'generatedAt': generated,
+            'updateTime': generated,
+            'validTimes': generated + '/P7DT14H',
+            'elevation': {'unitCode': 'wmoUnit:m', 'value': 2.1336},
+            'periods': periods,
+        },
+    }
+
+
+def weatherapi_forecast(epoch, days=1):
+    now = local_hour(epoch)
+    midnight = now.replace(hour=0)
+    forecast_days = []
+    for day in range(max(1, min(days, 3))):
+        day_midnight = midnight + timedelta(days=day)
+        forecast_days.append({
+            'date': day_midnight.strftime('%Y-%m-%d'),
+            'date_epoch': int(day_midnight.timestamp()),
+            'day': {'maxtemp_f': 76.0, 'mintemp_f': 55.0, 'daily_chance_of_rain': 80},
+            'astro': {'sunrise': '05:25 AM', 'sunset': '08:31 PM'},
+            'hour': weatherapi_hours(day_midnight),
+        })
+    return {
+        'location': {
+            'name': 'New York', 'region': 'New York', 'country': 'United States of America',
+            'lat': 40.71, 'lon': -74.01, 'tz_id': TIME_REGION,
+            'localtime_epoch': int(epoch), 'localtime': now.strftime('%Y-%m-%d %H:%M'),
+        },
+        'current': {
+            'last_updated_epoch': int(now.timestamp()), 'last_updated': now.strftime('%Y-%m-%d %H:%M'),
+            'temp_c': 17.2, 'temp_f': 63.0, 'is_day': 1,
+            'condition': {'text': 'Partly cloudy', 'icon': '//cdn.weatherapi.com/weather/64x64/day/116.png', 'code': 1003},
+            'wind_mph': 8.1, 'wind_kph': 13.0, 'humidity': 68, 'cloud': 50, 'feelslike_f': 63.0,
+        },
+        'forecast': {'forecastday': forecast_days},
+    }
+
+
+def weatherapi_hours(midnight):
+    hours = []
+    for hour in range(24):
+        stamp = midnight + timedelta(hours=hour)
+        rain = rain_chance(stamp)
+        temp_f = float(temperature(stamp))
+        hours.append({
+            'time_epoch': int(stamp.timestamp()),
+            'time': stamp.strftime('%Y-%m-%d %H:%M'),
+            'temp_c': round((temp_f - 32) / 1.8, 1),
+            'temp_f': temp_f,
+            'is_day': int(6 <= hour < 18),
+            'condition': {'text': 'Patchy rain nearby', 'icon': '//cdn.weatherapi.com/weather/64x64/day/176.png', 'code': 1063},
+            'wind_mph': 8.5, 'wind_kph': 13.7, 'wind_degree': 224, 'wind_dir': 'SW',
+            'pressure_mb': 1014.0, 'pressure_in': 29.95, 'precip_mm': 0.12, 'precip_in': 0.0,
+            'snow_cm': 0.0, 'humidity': 68, 'cloud': 74,
+            'feelslike_c': round((temp_f - 33) / 1.8, 1), 'feelslike_f': temp_f - 1.5,
+            'windchill_c': 17.1, 'windchill_f': 62.8, 'heatindex_c': 17.1, 'heatindex_f': 62.8,
+            'dewpoint_c': 11.2, 'dewpoint_f': 52.2,
+            'will_it_rain': int(rain >= 50), 'chance_of_rain': rain,
+            'will_it_snow': 0, 'chance_of_snow': 0,
+            'vis_km': 10.0, 'vis_miles': 6.0, 'gust_mph': 12.4, 'gust_kph': 20.0, 'uv': 1.0,
+        })
+    return hours
+
+
+def accuweather_location(epoch):
+    return {
+        'Version': 1, 'Key': ACCUWEATHER_KEY, 'Type': 'City', 'Rank': 15,
+        'LocalizedName': 'New York', 'EnglishName': 'New York', 'PrimaryPostalCode': '10007',
+        'Region': {'ID': 'NAM', 'LocalizedName': 'North America', 'EnglishName': 'North America'},
+        'Country': {'ID': 'US', 'LocalizedName': 'United States', 'EnglishName': 'United States'},
+        'AdministrativeArea': {'ID': 'NY', 'LocalizedName': 'New York', 'EnglishName': 'New York', 'Level': 1, 'LocalizedType': 'State', 'EnglishType': 'State', 'CountryID': 'US'},
+        'TimeZone': {'Code': 'EDT', 'Name': TIME_REGION, 'GmtOffset': -4.0, 'IsDaylightSaving': True},
+        'GeoPosition': {'Latitude': 40.713, 'Longitude': -74.006, 'Elevation': {'Metric': {'Value': 10.0, 'Unit': 'm', 'UnitType': 5}, 'Imperial': {'Value': 32.0, 'Unit': 'ft', 'UnitType': 0}}},
+        'IsAlias': False,
+        'SupplementalAdminAreas': [{'Level': 2, 'LocalizedName': 'New York', 'EnglishName': 'New York'}],
+        'DataSets': ['AirQualityCurrentConditions', 'AirQualityForecasts', 'Alerts', 'DailyPollenForecast', 'ForecastConfidence', 'FutureRadar', 'MinuteCast', 'Radar'],
+    }
+
+
+def accuweather_hourly(epoch):
+    start = local_hour(epoch) + timedelta(hours=1)
+    hours = []
+    for hour in range(12):
+        stamp = start + timedelta(hours=hour)
+        temp_f = float(temperature(stamp))
+        hours.append({
+            'DateTime': stamp.isoformat(),
+            'EpochDateTime': int(stamp.timestamp()),
+            'WeatherIcon': 12, 'IconPhrase': 'Showers', 'HasPrecipitation': True,
+            'PrecipitationType': 'Rain', 'PrecipitationIntensity': 'Light',
+            'IsDaylight': 6 <= stamp.hour < 18,
+            'Temperature': {'Value': temp_f, 'Unit': 'F', 'UnitType': 18},
+            'RealFeelTemperature': {'Value': temp_f - 2, 'Unit': 'F', 'UnitType': 18, 'Phrase': 'Pleasant'},
+            'PrecipitationProbability': rain_chance(stamp),
+            'MobileLink': 'http://www.accuweather.com/en/us/new-york-ny/10007/hourly-weather-forecast/349727',
+            'Link': 'http://www.accuweather.com/en/us/new-york-ny/10007/hourly-weather-forecast/349727',
+        })
+    return hours
+
+
+def worldtimeapi(epoch):
+    zone = ZoneInfo(TIME_REGION)
+    stamp = datetime.fromtimestamp(epoch, zone)
+    dst = int(stamp.dst().total_seconds())
+    return {
+        'abbreviation': stamp.tzname(), 'client_ip': '203.0.113.7', 'datetime': stamp.isoformat(),
+        'day_of_week': stamp.isoweekday() % 7, 'day_of_year': stamp.timetuple().tm_yday,
+        'dst': dst != 0, 'dst_offset': dst, 'raw_offset': int(stamp.utcoffset().total_seconds()) - dst,
+        'timezone': TIME_REGION, 'unixtime': int(epoch), 'utc_datetime': datetime.fromtimestamp(epoch, timezone.utc).isoformat(),
+        'utc_offset': stamp.strftime('%z')[:3] + ':' + stamp.strftime('%z')[3:], 'week_number': stamp.isocalendar()[1],
+    }
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b'blob ' + str(len(data)).encode() + b'\0' + data).hexdigest()
+
+
+class Release():
+    # The version GitHub reports for the branch. `files` are served from raw.githubusercontent.com
+    # and listed in the commit tree with their real blob hashes.
+    def __init__(self, firmware_dir, sha):
+        self.sha = sha
+        self.files = {}
+        for path in firmware_files(firmware_dir):
+            with open(os.path.join(firmware_dir, path), 'rb') as f:
+                self.files[path] = f.read()
+        # The release differs from the flashed copy in one file, so an update swaps something in
+        self.files['core.py'] = self.files['core.py'] + b'# release ' + sha.encode() + b'\r\n'
+        self.etag = 'W/"' + hashlib.sha1(sha.encode()).hexdigest() + '"'
+
+    def branch(self):
+        return {
+            'name': 'main',
+            'commit': {
+                'sha': self.sha,
+                'node_id': 'C_kwDOAAAAAA',
+                'commit': {'author': {'name': 'sim', 'email': 'sim@example.com', 'date': '2026-01-01T00:00:00Z'}, 'message': 'release', 'tree': {'sha': self.sha}},
+                'url': 'https://api.github.com/repos/' + REPO + '/commits/' + self.sha,
+                'parents': [],
+            },
+            '_links': {'self': 'https://api.github.com/repos/' + REPO + '/branches/main', 'html': 'https://github.com/' + REPO + '/tree/main'},
+            'protected': False,
+            'protection': {'enabled': False, 'required_status_checks': {'enforcement_level': 'off', 'contexts': [], 'checks': []}},
+            'protection_url': 'https://api.github.com/repos/' + REPO + '/branches/main/protection',
+        }
+
+    def tree(self):
+        entries = [{'path': '.gitignore', 'mode': '100644', 'type': 'blob', 'sha': git_blob_sha(b''), 'size': 0}]
+        for path, data in sorted(self.files.items()):
+            entries.append({'path': path, 'mode': '100644', 'type': 'blob', 'sha': git_blob_sha(data), 'size': len(data), 'url': 'https://api.github.com/repos/' + REPO + '/git/blobs/' + git_blob_sha(data)})
+        return {'sha': self.sha, 'url': 'https://api.github.com/repos/' + REPO + '/git/trees/' + self.sha, 'tree': entries, 'truncated': False}
+
+
+class Fixture_handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    release = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        elif not isinstance(body, bytes):
+            body = json.dumps(body, indent=4).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        host = self.headers.get('Host', '').split(':')[0]
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        epoch = float(self.headers.get(SIM_TIME_HEADER, '0'))
+        route = (host, url.path)
+        if host == 'api.weather.gov' and url.path.startswith('/points/'):
+            return self.send_body(200, weathergov_points(epoch), 'application/geo+json')
+        if route == ('api.weather.gov', GRID_PATH):
+            return self.send_body(200, json.dumps(weathergov_hourly(epoch), indent=4).encode(), 'application/geo+json')
+        if route == ('api.weatherapi.com', '/v1/forecast.json'):
+            return self.send_body(200, json.dumps(weatherapi_forecast(epoch, int(query.get('days', ['1'])[0]))).encode())
+        if route == ('dataservice.accuweather.com', '/locations/v1/cities/geoposition/search'):
+            return self.send_body(200, json.dumps(accuweather_location(epoch)).encode())
+        if route == ('dataservice.accuweather.com', '/forecasts/v1/hourly/12hour/' + ACCUWEATHER_KEY):
+            return self.send_body(200, json.dumps(accuweather_hourly(epoch)).encode())
+        if host == 'worldtimeapi.org' and url.path.startswith('/api/timezone/'):
+            return self.send_body(200, json.dumps(worldtimeapi(epoch)).encode())
+        if host == 'ip.me':
+            return self.send_body(200, '203.0.113.7\n', 'text/plain')
+        if route == ('api.github.com', '/repos/' + REPO + '/branches/main'):
+            if self.headers.get('If-None-Match') == self.release.etag:
+                self.send_response(304)
+                self.send_header('ETag', self.release.etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            return self.send_body(200, self.release.branch(), headers={'ETag': self.release.etag})
+        if route == ('api.github.com', '/repos/' + REPO + '/git/trees/' + self.release.sha):
+            return self.send_body(200, self.release.tree())
+        if host == 'raw.githubusercontent.com':
+            prefix = '/' + REPO + '/' + self.release.sha + '/'
+            if url.path.startswith(prefix) and url.path[len(prefix):] in self.release.files:
+                return self.send_body(200, self.release.files[url.path[len(prefix):]], 'text/plain; charset=utf-8')
+        self.send_body(404, {'status': 404, 'detail': 'No fixture for ' + host + url.path})
+
+
+class Fixture_server(ThreadingHTTPServer):
+    # The device drops pooled keep-alive connections whenever it likes, which is not an error
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+def serve(port, firmware_dir, release_sha):
+    Fixture_handler.release = Release(firmware_dir, release_sha)
+    server = Fixture_server(('127.0.0.1', port), Fixture_handler)
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recorded-shape provider responses for the simulator')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--firmware-dir', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument('--release-sha', default='0' * 40)
+    args = parser.parse_args()
+    try:
+        serve(args.port, args.firmware_dir, args.release_sha)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import builtins
+import gc
+import http.client
+import inspect
+import json
+import marshal
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime, timezone
+
+from simulator.aio import Virtual_loop
+from simulator.clock import Clock
+from simulator.device import DEEPSLEEP_RESET, SOFT_RESET, Device, SimulatedDeepSleep, SimulatedReset, module
+from simulator.fixtures import firmware_files
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run at boot in this order; any other firmware module is loaded when the firmware imports it
+FIRMWARE_FILES = ('boot.py', 'main.py')
+SSID = 'simulated-ap'
+RELEASE_SHA = 'a' * 40
+UPDATED_RELEASE_SHA = 'b' * 40
+PROVIDERS = ('weathergov', 'weatherapi', 'accuweather')
+
+# Functions timed as phases of a cycle. Nested phases (update_RTC inside sync_time) are counted
+# in both. Names missing from the firmware are skipped so the harness keeps working as it changes.
+PHASES = (
+    'manage_wifi',
+    'connect_wifi',
+    'disconnect_wifi',
+    'sync_time',
+    'update_RTC',
+    'validate_internet_connection',
+    'update_local_time',
+    'forecast_refresh_needed',
+    'map_hours_to_pins',
+    'send_map_to_leds',
+    'Check_for_updates.main',
+)
+
+
+class SimulationDone(BaseException):
+    pass
+
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def make_config(args):
+    with open(os.path.join(REPO_DIR, 'config.json'), 'r') as f:
+        config = json.load(f)
+    config['NETWORK']['SSID'] = SSID
+    config['NETWORK']['PSK'] = 'simulated-psk'
+    config['LOCATION']['LATITUDE'] = '40.7128'
+    config['LOCATION']['LONGITUDE'] = '-74.0060'
+    config['ACCUWEATHER_API_KEY'] = 'simulated'
+    config['WEATHERAPI_API_KEY'] = 'simulated'
+    config.pop('PROVIDER', None)
+    config['PROVIDERS'] = args.provider.split(',')
+    config.setdefault('LOG', {})['CONSOLE'] = args.verbose
+    config.setdefault('POWER', {})['DEEP_SLEEP'] = args.deep_sleep
+    if args.panels:
+        config['LED']['PANELS'] = json.loads(args.panels)
+    return config
+
+
+def start_fixture_server(firmware_dir, release_sha):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'simulator.fixtures', '--firmware-dir', firmware_dir, '--release-sha', release_sha],
+        cwd=REPO_DIR,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    port = int(server.stdout.readline())
+    return server, port
+
+
+def warm_up(port):
+    # The first request through http.client or asyncio imports codecs, parsers and loop machinery
+    # lazily, which would otherwise land in the first cycle's peak allocation
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    connection.request('GET', '/', headers={'Host': 'ip.me'})
+    connection.getresponse().read()
+    connection.close()
+
+    async def request():
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET / HTTP/1.0\r\nHost: ip.me\r\n\r\n')
+        await reader.read()
+        writer.close()
+    with asyncio.Runner(loop_factory=lambda: Virtual_loop(Clock(0))) as runner:
+        runner.run(request())
+
+
+class Stats():
+    def __init__(self, device):
+        self.device = device
+        self.started_wall = time.perf_counter()
+        self.started_virtual = device.clock.true
+        self.started_counters = device.counters.snapshot()
+
+    def finish(self):
+        counters = self.device.counters.snapshot()
+        return {
+            'wall_ms': round((time.perf_counter() - self.started_wall) * 1000, 3),
+            'virtual_ms': round((self.device.clock.true - self.started_virtual) * 1000, 3),
+            'requests': counters[0] - self.started_counters[0],
+            'connections': counters[1] - self.started_counters[1],
+            'bytes_read': counters[2] - self.started_counters[2],
+            'bytes_offered': counters[3] - self.started_counters[3],
+            'neopixel_writes': counters[4] - self.started_counters[4],
+        }
+
+
+class Simulation():
+    def __init__(self, args, device, firmware_dir, console):
+        self.args = args
+        self.device = device
+        self.firmware_dir = firmware_dir
+        self.console = console
+        self.cycles = []
+        self.boots = []
+        self.cycle = None
+        self.modules = {}
+        self.loaded = []
+        self.sizes = {}
+        self.compiled = {}
+
+    def firmware_import(self, fakes):
+        host_import = builtins.__import__
+
+        def firmware_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if name in fakes:
+                return fakes[name]
+            if name in self.modules:
+                return self.modules[name]
+            if os.path.exists(name + '.py'):
+                return self.load_module(name)
+            if os.path.exists(os.path.join(REPO_DIR, name + '.py')):
+                # Missing from the device, and the host must not import the repo's copy instead
+                raise ImportError('no module named ' + name)
+            return host_import(name, globals, locals, fromlist, level)
+        return firmware_import
+
+    def compiled_code(self, path):
+        # Compile time and marshalled code size stand in for the board's compile time and bytecode,
+        # and are charged to whatever imports the module
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if path not in self.compiled or self.compiled[path][0] != key:
+            started = time.perf_counter()
+            with open(path, 'r') as f:
+                code = compile(f.read(), os.path.join(self.firmware_dir, path), 'exec')
+            self.compiled[path] = (key, code, round((time.perf_counter() - started) * 1000, 3), len(marshal.dumps(code)))
+        return self.compiled[path]
+
+    def precompile(self):
+        # Compiled at boot outside the traced heap, so the host's compiler does not count toward a
+        # cycle's peak. A file boot.py rolls back is compiled again when it is loaded.
+        for path in firmware_files('.'):
+            self.compiled_code(path)
+
+    def compile_firmware(self, path):
+        key, code, compile_ms, size = self.compiled_code(path)
+        self.sizes[path[:-3]] = size
+        self.loaded.append({'module': path[:-3], 'compile_ms': compile_ms, 'bytecode_bytes': size})
+        return code
+
+    def load_module(self, name):
+        # A firmware module, one instance per boot in the firmware's own sys.modules, so a module
+        # the firmware releases is compiled again the next time it is imported
+        code = self.compile_firmware(name + '.py')
+        firmware_module = types.ModuleType(name)
+        firmware_module.__dict__.update({'__builtins__': self.firmware_builtins, '__file__': name + '.py'})
+        self.modules[name] = firmware_module
+        exec(code, firmware_module.__dict__)
+        self.instrument_phases(firmware_module.__dict__)
+        return firmware_module
+
+    def take_loaded(self):
+        loaded = self.loaded
+        self.loaded = []
+        return {
+            'modules': [entry['module'] for entry in loaded],
+            'compile_ms': round(sum(entry['compile_ms'] for entry in loaded), 3),
+            'bytecode_bytes': sum(entry['bytecode_bytes'] for entry in loaded),
+        }
+
+    def resident_bytecode(self):
+        # boot.py and main.py stay resident as the board's __main__ namespace
+        names = [name for name in self.sizes if name in self.modules or name + '.py' in FIRMWARE_FILES]
+        return sum(self.sizes[name] for name in names)
+
+    def firmware_print(self, *values, sep=' ', end='\n', file=None):
+        self.console.write(sep.join(str(value) for value in values) + end)
+
+    def boot(self):
+        fakes = self.device.modules()
+        self.modules = {}
+        fakes['sys'] = module('sys', modules=self.modules)
+        firmware_import = self.firmware_import(fakes)
+        self.firmware_builtins = dict(vars(builtins))
+        self.firmware_builtins['__import__'] = firmware_import
+        self.firmware_builtins['print'] = self.firmware_print
+        boot = {'at': iso(self.device.clock.true), 'reset_cause': self.device.reset_cause}
+        self.boots.append(boot)
+        self.booted_at = self.device.clock.true
+        self.device.first_write_at = None
+        self.precompile()
+        gc.collect()
+        heap_before = tracemalloc.get_traced_memory()[0]
+        self.loaded = []
+        for path in FIRMWARE_FILES:
+            # The single file firmware had no boot.py
+            if os.path.exists(path):
+                namespace = {'__builtins__': self.firmware_builtins, '__name__': path[:-3], '__file__': path}
+                exec(self.compile_firmware(path), namespace)
+        if 'main' not in namespace:
+            # A split firmware: main.py only imports core.py and starts it when it runs as __main__,
+            # installing the rest of the release first when it is missing
+            if not os.path.exists('core.py'):
+                namespace['install_package']()
+            namespace = firmware_import('core').__dict__
+        gc.collect()
+        # What booting compiled, and the heap it left allocated
+        boot.update(self.take_loaded())
+        boot['heap_bytes'] = tracemalloc.get_traced_memory()[0] - heap_before
+        self.device.mark_heap()
+        return namespace
+
+    def wrap_phase(self, name, function):
+        def record(label, stats):
+            totals = self.cycle['phases'].setdefault(label, {'calls': 0})
+            totals['calls'] = totals['calls'] + 1
+            for key, value in stats.finish().items():
+                totals[key] = round(totals.get(key, 0) + value, 3)
+
+        def label_for(args, kwargs):
+            if name == 'manage_wifi':
+                return 'wifi_' + (args[0] if args else kwargs.get('action', 'connect'))
+            if name in ('connect_wifi', 'disconnect_wifi'):
+                return 'wifi_' + name.split('_')[0]
+            return name
+
+        def timed(*args, **kwargs):
+            if self.cycle is None:
+                return function(*args, **kwargs)
+            stats = Stats(self.device)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(label_for(args, kwargs), stats)
+
+        async def timed_async(*args, **kwargs):
+            if self.cycle is None:
+                return await function(*args, **kwargs)
+            stats = Stats(self.device)
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                record(label_for(args, kwargs), stats)
+        return timed_async if inspect.iscoroutinefunction(function) else timed
+
+    def instrument_phases(self, namespace):
+        for phase in PHASES:
+            owner_name, _, attribute = phase.rpartition('.')
+            owner = namespace.get(owner_name) if owner_name else None
+            if owner_name:
+                if owner is None or not hasattr(owner, attribute):
+                    continue
+                setattr(owner, attribute, self.wrap_phase(phase, getattr(owner, attribute)))
+            elif phase in namespace:
+                namespace[phase] = self.wrap_phase(phase, namespace[phase])
+
+    def instrument(self, namespace):
+        if namespace['__file__'] == 'main.py':
+            # Modules loaded through firmware_import are instrumented as they load
+            self.instrument_phases(namespace)
+        main_loop = namespace['main_loop']
+
+        def counted_main_loop():
+            if len(self.cycles) >= self.args.cycles:
+                raise SimulationDone()
+            self.start_cycle()
+            try:
+                result = main_loop()
+            finally:
+                self.finish_cycle(namespace)
+            if len(self.cycles) in self.args.reset_after:
+                raise SimulatedReset()
+            return result
+        namespace['main_loop'] = counted_main_loop
+
+    def start_cycle(self):
+        tracemalloc.reset_peak()
+        self.cycle = {
+            'cycle': len(self.cycles) + 1,
+            'started_at': iso(self.device.clock.true),
+            'started_true': self.device.clock.true,
+            'phases': {},
+            'baseline_bytes': tracemalloc.get_traced_memory()[0],
+            'stats': Stats(self.device),
+        }
+        self.loaded = []
+
+    def finish_cycle(self, namespace):
+        cycle = self.cycle
+        self.cycle = None
+        boot = self.boots[-1]
+        if 'first_write_ms' not in boot and self.device.first_write_at is not None:
+            # How long the strips stayed dark after this boot
+            boot['first_write_ms'] = round((self.device.first_write_at - self.booted_at) * 1000, 3)
+        current, peak = tracemalloc.get_traced_memory()
+        result = {'cycle': cycle['cycle'], 'started_at': cycle['started_at']}
+        result.update(cycle['stats'].finish())
+        result['peak_alloc_bytes'] = peak - cycle['baseline_bytes']
+        result['retained_bytes'] = current - cycle['baseline_bytes']
+        result['local_hour'] = namespace.get('HOUR')
+        # How far from the top of the local hour the cycle started, negative when it was early
+        past_hour = (cycle['started_true'] + (namespace.get('UTC_OFFSET') or 0)) % 3600
+        result['seconds_past_hour'] = round(past_hour - 3600 if past_hour >= 1800 else past_hour, 3)
+        result['rtc_error_seconds'] = round(self.device.clock.device_time() - self.device.clock.true, 3)
+        result['phases'] = cycle['phases']
+        # Modules the cycle imported, and the bytecode still loaded once it finished
+        result['modules'] = self.take_loaded()
+        result['resident_bytecode_bytes'] = self.resident_bytecode()
+        self.cycles.append(result)
+
+    def run(self):
+        outcome = 'completed'
+        while True:
+            try:
+                namespace = self.boot()
+                self.instrument(namespace)
+                namespace['main']()
+            except SimulationDone:
+                break
+            except SimulatedDeepSleep as sleep:
+                # The deep sleep timer counts on the RTC's clock, so it drifts along with it
+                self.device.clock.advance_ms(sleep.ms / (1 + self.device.clock.drift_ppm / 1e6))
+                self.device.reset_cause = DEEPSLEEP_RESET
+            except SimulatedReset:
+                self.device.reset_cause = SOFT_RESET
+            except Exception as e:
+                # Same recovery as the __main__ guard in main.py: reset while an update is pending
+                if 'update_pending.json' in os.listdir():
+                    self.device.reset_cause = SOFT_RESET
+                    continue
+                outcome = f'crashed: {type(e).__name__}: {e}'
+                break
+        return outcome
+
+
+def parse_host_values(values, default):
+    parsed = {}
+    for value in values or ():
+        host, _, amount = value.partition('=')
+        parsed[host] = int(amount or default)
+    return parsed
+
+
+def parse_start(value):
+    stamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return stamp.timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run main_loop against simulated hardware and recorded-shape provider responses')
+    parser.add_argument('--provider', default='weathergov', help='provider, or comma separated providers in priority order')
+    parser.add_argument('--cycles', type=int, default=3)
+    parser.add_argument('--start', default='2026-06-01T07:00:05-04:00', help='simulated wall clock at power on (ISO 8601)')
+    parser.add_argument('--drift-ppm', type=float, default=0.0, help='RTC drift between NTP syncs')
+    parser.add_argument('--deep-sleep', action='store_true', help='run with POWER.DEEP_SLEEP enabled')
+    parser.add_argument('--update-available', action='store_true', help='publish a new version for the OTA check')
+    parser.add_argument('--fail', action='append', metavar='HOST=COUNT', help='fail the next COUNT requests to HOST')
+    parser.add_argument('--latency', action='append', metavar='HOST=MS', help='add MS of latency to every request to HOST')
+    parser.add_argument('--panels', help='LED.PANELS as a JSON list, in place of the rain and temp strips')
+    parser.add_argument('--reset-after', type=int, action='append', default=[], metavar='CYCLE', help='reset the board once CYCLE has finished')
+    parser.add_argument('--legacy-upgrade', action='store_true', help='start as a board the single file firmware just updated, with only main.py on flash')
+    parser.add_argument('--firmware', default=REPO_DIR, help='directory holding boot.py, main.py and the modules they import')
+    parser.add_argument('--out', default=os.path.join(tempfile.gettempdir(), 'sim_results.json'))
+    parser.add_argument('--verbose', action='store_true', help='echo the firmware console')
+    args = parser.parse_args(argv)
+    for provider in args.provider.split(','):
+        if provider not in PROVIDERS:
+            parser.error(f'unknown provider {provider}')
+
+    device_dir = tempfile.mkdtemp(prefix='rain-sim-')
+    try:
+        return simulate(args, device_dir)
+    finally:
+        shutil.rmtree(device_dir, ignore_errors=True)
+
+
+def simulate(args, device_dir):
+    for path in ['main.py'] if args.legacy_upgrade else firmware_files(args.firmware):
+        shutil.copy(os.path.join(args.firmware, path), device_dir)
+    with open(os.path.join(device_dir, 'config.json'), 'w') as f:
+        f.write(json.dumps(make_config(args), indent=4))
+    with open(os.path.join(device_dir, 'version.txt'), 'w') as f:
+        f.write(RELEASE_SHA)
+    server, port = start_fixture_server(args.firmware, UPDATED_RELEASE_SHA if args.update_available else RELEASE_SHA)
+    warm_up(port)
+    clock = Clock(parse_start(args.start), args.drift_ppm)
+    device = Device(clock, port, SSID, parse_host_values(args.fail, 1), parse_host_values(args.latency, 0))
+    console = sys.stdout if args.verbose else open(os.path.join(device_dir, 'console.log'), 'w')
+    previous_dir = os.getcwd()
+    out = os.path.abspath(args.out)
+    tracemalloc.start()
+    os.chdir(device_dir)
+    try:
+        simulation = Simulation(args, device, device_dir, console)
+        outcome = simulation.run()
+    finally:
+        os.chdir(previous_dir)
+        tracemalloc.stop()
+        server.terminate()
+        server.wait()
+        if console is not sys.stdout:
+            console.close()
+
+    results = {
+        'provider': args.provider,
+        'start': iso(parse_start(args.start)),
+        'deep_sleep': args.deep_sleep,
+        'update_available': args.update_available,
+        'drift_ppm': args.drift_ppm,
+        'outcome': outcome,
+        'boots': simulation.boots,
+        'cycles': simulation.cycles,
+        'totals': {
+            'cycles': len(simulation.cycles),
+            'requests': sum(cycle['requests'] for cycle in simulation.cycles),
+            'bytes_read': sum(cycle['bytes_read'] for cycle in simulation.cycles),
+            'neopixel_writes': sum(cycle['neopixel_writes'] for cycle in simulation.cycles),
+            'peak_alloc_bytes': max([cycle['peak_alloc_bytes'] for cycle in simulation.cycles] or [0]),
+        },
+    }
+    with open(out, 'w') as f:
+        f.write(json.dumps(results, indent=2))
+    print(f'{args.provider}: {outcome}, {len(simulation.cycles)} cycles, {results["totals"]["requests"]} requests, '
+          f'{results["totals"]["bytes_read"]} bytes read, peak {results["totals"]["peak_alloc_bytes"]} bytes -> {out}')
+    return 0 if outcome == 'completed' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import http.client
+import json as ujson
+import types
+from urllib.parse import urlsplit
+
+from simulator.fixtures import SIM_TIME_HEADER
+
+# Virtual latency per request, in milliseconds, and the sustained download rate. TLS handshakes
+# on an ESP32 are the dominant cost, which is what connection reuse work needs to show.
+DNS_MS = 25
+CONNECT_MS = 45
+TLS_HANDSHAKE_MS = 850
+FIRST_BYTE_MS = 120
+DOWNLOAD_BYTES_PER_SECOND = 120000
+
+
+class Raw():
+    # Stands in for the socket urequests exposes as `response.raw`
+    def __init__(self, device, response):
+        self.device = device
+        self.response = response
+
+    def read(self, size=-1):
+        if self.response is None:
+            return b''
+        data = self.response.read() if size is None or size < 0 else self.response.read(size)
+        self.device.counters.bytes_read = self.device.counters.bytes_read + len(data)
+        self.device.clock.advance(len(data) / DOWNLOAD_BYTES_PER_SECOND)
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+
+class Response():
+    def __init__(self, device, connection, response):
+        self.connection = connection
+        self.raw = Raw(device, response)
+        self.status_code = response.status
+        self.reason = response.reason.encode()
+        self.headers = dict(response.getheaders())
+        self.encoding = 'utf-8'
+        self._cached = None
+
+    def close(self):
+        self.raw.close()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @property
+    def content(self):
+        if self._cached is None:
+            try:
+                self._cached = self.raw.read()
+            finally:
+                self.close()
+        return self._cached
+
+    @property
+    def text(self):
+        return str(self.content, self.encoding)
+
+    def json(self):
+        return ujson.loads(self.content)
+
+
+def make_module(device):
+    def request(method, url, data=None, json=None, headers=None, stream=None, auth=None, timeout=None, parse_headers=True):
+        parts = urlsplit(url)
+        host = parts.hostname
+        if not device.network_up():
+            device.clock.advance_ms(DNS_MS)
+            raise OSError(-202)
+        remaining = device.failures.get(host, 0)
+        if remaining:
+            device.failures[host] = remaining - 1
+            device.clock.advance_ms(DNS_MS + CONNECT_MS)
+            raise OSError(104)
+        device.counters.requests = device.counters.requests + 1
+        device.counters.connections = device.counters.connections + 1
+        latency = DNS_MS + CONNECT_MS + FIRST_BYTE_MS + device.extra_latency.get(host, 0)
+        if parts.scheme == 'https':
+            latency = latency + TLS_HANDSHAKE_MS
+        device.clock.advance_ms(latency)
+        path = parts.path or '/'
+        if parts.query:
+            path = path + '?' + parts.query
+        send_headers = {'Host': host, SIM_TIME_HEADER: repr(device.clock.true), 'Connection': 'close'}
+        send_headers.update(headers or {})
+        body = data
+        if json is not None:
+            body = ujson.dumps(json)
+            send_headers['Content-Type'] = 'application/json'
+        connection = http.client.HTTPConnection('127.0.0.1', device.fixture_port, timeout=30)
+        connection.request(method, path, body=body, headers=send_headers)
+        response = connection.getresponse()
+        offered = response.getheader('Content-Length')
+        if offered is not None:
+            device.counters.bytes_offered = device.counters.bytes_offered + int(offered)
+        return Response(device, connection, response)
+
+    fake = types.ModuleType('urequests')
+    fake.request = request
+    fake.get = lambda url, **kw: request('GET', url, **kw)
+    fake.head = lambda url, **kw: request('HEAD', url, **kw)
+    fake.post = lambda url, **kw: request('POST', url, **kw)
+    fake.put = lambda url, **kw: request('PUT', url, **kw)
+    fake.delete = lambda url, **kw: request('DELETE', url, **kw)
+    fake.Response = Response
+    return fake
@@ -0,0 +1,295 @@
+import argparse
+import builtins
+import calendar
+import gc
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fetches each location's forecast once per refresh and serves it to every display on the LAN as
+# one binary frame (GATEWAY_HEADER in core.py), which devices read with the "gateway" provider:
+#
+#   python tools/gateway.py --location home=home_config.json --port 8080
+#
+# and on each device "PROVIDERS" : ["gateway"], "GATEWAY_URL" : "http://<host>:8080/home".
+#
+# Every location runs its own copy of the firmware on the host, with the board-only modules below
+# standing in, so the providers, parsers and merge rules are exactly the devices' own.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The gateway fetches every metric, whatever the displays at a location show
+GATEWAY_METRICS = ('rain', 'temp', 'feels')
+TICKS_PERIOD = 1 << 30
+
+
+def module(name, **members):
+    host = types.ModuleType(name)
+    host.__dict__.update(members)
+    return host
+
+
+def make_time():
+    # MicroPython semantics: integer seconds, UTC localtime tuples and wrapping ticks
+    def localtime(seconds=None):
+        return tuple(time.gmtime(time.time() if seconds is None else seconds))[:8]
+
+    def mktime(stamp):
+        return calendar.timegm(tuple(stamp[:6]))
+
+    def ticks_diff(end, start):
+        return ((end - start + TICKS_PERIOD // 2) % TICKS_PERIOD) - TICKS_PERIOD // 2
+
+    return module(
+        'time',
+        time=lambda: int(time.time()),
+        localtime=localtime,
+        gmtime=localtime,
+        mktime=mktime,
+        sleep=time.sleep,
+        sleep_ms=lambda ms: time.sleep(ms / 1000.0),
+        ticks_ms=lambda: int(time.monotonic() * 1000) % TICKS_PERIOD,
+        ticks_diff=ticks_diff,
+        ticks_add=lambda ticks, delta: (ticks + delta) % TICKS_PERIOD,
+    )
+
+
+def make_machine():
+    class Pin():
+        IN = 0
+        OUT = 1
+
+        def __init__(self, pin, mode=-1, pull=-1, value=None, hold=False):
+            self.pin = pin
+
+    class RTC():
+        def __init__(self):
+            self.data = b''
+
+        def memory(self, data=None):
+            if data is None:
+                return self.data
+            self.data = bytes(data)
+
+    def reset():
+        raise SystemExit('the firmware asked for a reset')
+
+    return module('machine', Pin=Pin, RTC=RTC, reset=reset, deepsleep=lambda ms=0: reset(), reset_cause=lambda: 1, PWRON_RESET=1, DEEPSLEEP_RESET=4)
+
+
+def make_network():
+    # The host is always online
+    class WLAN():
+        def __init__(self, interface=0):
+            pass
+
+        def active(self, state=None):
+            return True
+
+        def isconnected(self):
+            return True
+
+        def ifconfig(self, config=None):
+            return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+        def connect(self, *args, **kwargs):
+            pass
+
+        def disconnect(self):
+            pass
+
+        def config(self, *args, **kwargs):
+            pass
+
+        def scan(self):
+            return []
+
+    return module('network', WLAN=WLAN, STA_IF=0)
+
+
+def make_neopixel():
+    class NeoPixel():
+        ORDER = (1, 0, 2, 3)
+
+        def __init__(self, pin, n, bpp=3, timing=1):
+            self.n = n
+            self.buf = bytearray(n * bpp)
+
+        def __len__(self):
+            return self.n
+
+        def __setitem__(self, index, value):
+            for channel in range(3):
+                self.buf[index * 3 + self.ORDER[channel]] = value[channel]
+
+        def fill(self, value):
+            for index in range(self.n):
+                self[index] = value
+
+        def write(self):
+            pass
+
+    return module('neopixel', NeoPixel=NeoPixel)
+
+
+def host_modules():
+    return {
+        'time': make_time(),
+        'machine': make_machine(),
+        'network': make_network(),
+        'neopixel': make_neopixel(),
+        'ntptime': module('ntptime', settime=lambda: None),
+        'micropython': module('micropython', const=lambda value: value),
+        'gc': module('gc', collect=gc.collect, mem_free=lambda: 0, mem_alloc=lambda: 0),
+    }
+
+
+def load_firmware(firmware_dir):
+    # Imports core.py with the board-only modules swapped for the host ones. Each location gets its
+    # own sys.modules, so the modules core.py imports on demand and releases stay per location.
+    modules = {}
+    fakes = host_modules()
+    fakes['sys'] = module('sys', modules=modules)
+    host_import = builtins.__import__
+
+    def firmware_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if name in fakes:
+            return fakes[name]
+        if name in modules:
+            return modules[name]
+        path = os.path.join(firmware_dir, name + '.py')
+        if not os.path.exists(path):
+            return host_import(name, globals, locals, fromlist, level)
+        firmware_module = module(name, __builtins__=firmware_builtins, __file__=path)
+        modules[name] = firmware_module
+        with open(path, 'r') as f:
+            exec(compile(f.read(), path, 'exec'), firmware_module.__dict__)
+        return firmware_module
+    firmware_builtins = dict(vars(builtins))
+    firmware_builtins['__import__'] = firmware_import
+    return firmware_import('core').__dict__
+
+
+def pack_frame(firmware, forecast):
+    # Hours are trimmed after the last one with data. The ETag only covers the forecast itself, so
+    # a refresh that returns the same values still answers devices with a 304.
+    hours = 0
+    for index in range(firmware['FORECAST_HOURS']):
+        if forecast.has(index):
+            hours = index + 1
+    body = b''
+    for metric in firmware['FORECAST_METRICS']:
+        values = forecast.values[metric][:hours]
+        body = body + struct.pack('<' + str(hours) + firmware['FORECAST_TYPECODES'][metric], *values)
+    offset = firmware['UTC_OFFSET']
+    etag = '"' + hashlib.sha1(struct.pack('<iI', offset, forecast.start) + body).hexdigest()[:16] + '"'
+    header = struct.pack(firmware['GATEWAY_HEADER'], firmware['GATEWAY_MAGIC'], 1, firmware['HOUR'], firmware['DAY'], hours, offset, int(time.time()), forecast.start)
+    return header + body, etag
+
+
+class In_directory():
+    # The firmware keeps its config and state files in the working directory
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.previous = os.getcwd()
+        os.chdir(self.path)
+
+    def __exit__(self, *exc):
+        os.chdir(self.previous)
+
+
+class Location():
+    def __init__(self, name, config_path, state_dir, firmware_dir, hours):
+        self.name = name
+        self.dir = os.path.join(state_dir, name)
+        self.frame = None
+        os.makedirs(self.dir, exist_ok=True)
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        config['LED']['FIRST_BAR_HOUR'] = 0
+        config['LED']['PANELS'] = [{'NAME': metric, 'GPIO_PIN': 0, 'METRIC': metric, 'HOURS': hours} for metric in GATEWAY_METRICS]
+        if 'gateway' in config.get('PROVIDERS', []):
+            raise ValueError(name + ' would fetch from the gateway itself')
+        with open(os.path.join(self.dir, 'config.json'), 'w') as f:
+            json.dump(config, f, indent=4)
+        with In_directory(self.dir):
+            self.firmware = load_firmware(firmware_dir)
+
+    async def fetch(self):
+        await self.firmware['update_local_time']()
+        return await self.firmware['fetch_forecast']()
+
+    def refresh(self):
+        firmware = self.firmware
+        with In_directory(self.dir):
+            # The host clock is kept in sync by the OS
+            firmware['RTC_SYNCED'] = True
+            forecast = firmware['run_online'](self.fetch())
+        self.frame = pack_frame(firmware, forecast)
+        print(f'{self.name}: serving {len(self.frame[0])} byte frame {self.frame[1]}', flush=True)
+
+
+class Frame_handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    locations = {}
+
+    def send_frame(self, status, etag=None, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        location = self.locations.get(self.path.strip('/'))
+        frame = None if location is None else location.frame
+        if frame is None:
+            return self.send_frame(404)
+        body, etag = frame
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_frame(304, etag)
+        self.send_frame(200, etag, body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch each location once and serve it to the displays on the LAN as binary frames')
+    parser.add_argument('--location', action='append', required=True, metavar='NAME=CONFIG', help='location name and the device config.json to fetch it with; repeat for more locations')
+    parser.add_argument('--bind', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--refresh-minutes', type=float, default=30)
+    parser.add_argument('--hours', type=int, default=48, help='hours from local midnight to fetch, at most 48')
+    parser.add_argument('--state-dir', default=os.path.join(os.path.expanduser('~'), '.rain-gateway'), help='per location config, caches and endpoint health')
+    parser.add_argument('--firmware', default=REPO_DIR, help='directory holding core.py and the modules it imports')
+    args = parser.parse_args(argv)
+
+    locations = {}
+    for value in args.location:
+        name, _, config_path = value.partition('=')
+        locations[name] = Location(name, os.path.abspath(config_path), os.path.abspath(args.state_dir), os.path.abspath(args.firmware), min(args.hours, 48))
+    Frame_handler.locations = locations
+    server = ThreadingHTTPServer((args.bind, args.port), Frame_handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        while True:
+            for location in locations.values():
+                try:
+                    location.refresh()
+                except Exception as e:
+                    print(f'{location.name}: refresh failed, still serving the last frame. Error: {type(e).__name__} {e}', flush=True)
+            time.sleep(args.refresh_minutes * 60)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
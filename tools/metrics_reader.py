@@ -0,0 +1,111 @@
+import argparse
+import csv
+import json
+import os
+import statistics
+import struct
+import sys
+from datetime import datetime, timezone
+
+# Decodes metrics.bin journals copied off devices (for example `mpremote cp :metrics.bin dev1.bin`).
+# The layout matches Metrics_journal in core.py.
+
+METRICS_MAGIC = b'RCMJ'
+METRICS_HEADER = '<4sBBHHHI'
+METRICS_RECORD = '<IIBBBBIIII'
+METRICS_PHASES = ('cycle', 'wifi', 'internet', 'ntp', 'time', 'update', 'fetch', 'parse', 'leds')
+RESET_CAUSES = {1: 'power_on', 2: 'hard', 3: 'watchdog', 4: 'deep_sleep', 5: 'soft'}
+EPOCH_OFFSETS = {1970: 0, 2000: 946684800}
+FIELDS = ('device', 'sequence', 'time', 'phase', 'reset_cause', 'retries', 'ok', 'duration_ms', 'heap_before', 'heap_after', 'bytes')
+
+
+def read_journal(path, device=None):
+    with open(path, 'rb') as f:
+        data = f.read()
+    header_size = struct.calcsize(METRICS_HEADER)
+    if len(data) < header_size:
+        raise ValueError(path + ' is too short to be a metrics journal')
+    magic, version, record_size, slots, epoch_year, _, next_sequence = struct.unpack_from(METRICS_HEADER, data)
+    if magic != METRICS_MAGIC or version != 1 or record_size != struct.calcsize(METRICS_RECORD):
+        raise ValueError(path + ' is not a version 1 metrics journal')
+    device = device or os.path.splitext(os.path.basename(path))[0]
+    records = []
+    for offset in range(header_size, min(len(data), header_size + slots * record_size) - record_size + 1, record_size):
+        values = struct.unpack_from(METRICS_RECORD, data, offset)
+        sequence = values[0]
+        if sequence == 0 or sequence >= next_sequence:
+            continue
+        stamp = datetime.fromtimestamp(values[1] + EPOCH_OFFSETS.get(epoch_year, 0), timezone.utc)
+        records.append({
+            'device': device,
+            'sequence': sequence,
+            'time': stamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'phase': METRICS_PHASES[values[2]] if values[2] < len(METRICS_PHASES) else str(values[2]),
+            'reset_cause': RESET_CAUSES.get(values[3], str(values[3])),
+            'retries': values[4],
+            'ok': bool(values[5]),
+            'duration_ms': values[6],
+            'heap_before': values[7],
+            'heap_after': values[8],
+            'bytes': values[9],
+        })
+    records.sort(key=lambda record: record['sequence'])
+    return records
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(records):
+    # Phases nest: parse runs inside fetch, and every phase inside cycle
+    phases = {}
+    for record in records:
+        phases.setdefault(record['phase'], []).append(record)
+    summary = {}
+    for phase in sorted(phases, key=lambda name: METRICS_PHASES.index(name) if name in METRICS_PHASES else len(METRICS_PHASES)):
+        entries = phases[phase]
+        durations = [entry['duration_ms'] for entry in entries]
+        summary[phase] = {
+            'count': len(entries),
+            'failures': sum(1 for entry in entries if not entry['ok']),
+            'retries': sum(entry['retries'] for entry in entries),
+            'mean_ms': round(statistics.mean(durations), 1),
+            'p50_ms': percentile(durations, .5),
+            'p95_ms': percentile(durations, .95),
+            'max_ms': max(durations),
+            'mean_bytes': round(statistics.mean(entry['bytes'] for entry in entries)),
+            'min_heap_free': min(min(entry['heap_before'], entry['heap_after']) for entry in entries),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode metrics.bin journals to CSV or JSON')
+    parser.add_argument('journals', nargs='+', help='journal files, one per device; the file name is used as the device name')
+    parser.add_argument('--format', choices=('csv', 'json', 'summary'), default='csv')
+    parser.add_argument('--out', help='write here instead of stdout')
+    args = parser.parse_args(argv)
+
+    records = []
+    for path in args.journals:
+        records.extend(read_journal(path))
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        if args.format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+        elif args.format == 'json':
+            out.write(json.dumps(records, indent=2) + '\n')
+        else:
+            out.write(json.dumps(summarize(records), indent=2) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
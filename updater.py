@@ -0,0 +1,184 @@
+import os
+import json
+import binascii
+import hashlib
+import machine
+import core
+from json_stream import JSON_extractor, stream_json
+
+class Check_for_updates():
+    # Every top level .py file of the new commit is the firmware, so modules added or split out in a
+    # release arrive with it. Files are streamed to <name>.new while their git blob hash is computed,
+    # checked against the commit's tree, then swapped in with renames. The replaced files are kept
+    # as <name>.bak and boot.py restores them if the new version never reaches main_loop (see
+    # confirm_update in core.py).
+    def __init__(self):
+        core.log('Initializing update checker')
+        self.Raw_url = 'https://raw.githubusercontent.com/' + core.REPO + '/'
+        self.Version_hash_url = 'https://api.github.com/repos/' + core.REPO + '/branches/main'
+        self.Tree_url = 'https://api.github.com/repos/' + core.REPO + '/git/trees/'
+        self.Request_headers = {'user-agent':os.uname().sysname}
+        self.etag = None
+    def get_version_from_disk(self):
+        core.log('  >> Getting version from disk')
+        if core.VERSION_TRACKER_FILE in os.listdir():
+            try:
+                with open(core.VERSION_TRACKER_FILE, 'r') as f:
+                    version = f.read()
+                core.log(f'    >> {version} found on disk')
+            except Exception as e:
+                core.log(f'    >> Failed to read version file. error: {e}')
+                return
+        else:
+            core.log('    >> No version file found on disk, assuming version 0')
+            version = '0'
+        return version
+    async def get_version_from_github(self, current_version):
+        try:
+            core.log('  >> Trying to get latest github repo version hash')
+            headers = {'user-agent':os.uname().sysname}
+            if core.VERSION_ETAG_FILE in os.listdir():
+                with open(core.VERSION_ETAG_FILE, 'r') as f:
+                    headers['If-None-Match'] = f.read()
+            response = await core.HTTP.get(self.Version_hash_url, headers)
+            if response.status_code == 304:
+                response.close()
+                core.log('    >> Branch unchanged since the last check')
+                return current_version
+            # Kept by save_etag only once this version is installed or known to be current
+            self.etag = response.headers.get('etag')
+            version = (await response.json())['commit']['sha']
+            core.log(f'    >> {version} retrieved')
+            return version
+        except Exception as e:
+            core.log(f'    >> Failed. Error: {e}')
+            return ''
+    async def get_file_hashes(self, version):
+        core.log('  >> Getting file hashes for the new version')
+        hashes = {}
+        def add(record):
+            path = record.get('path')
+            if record.get('type') == 'blob' and path.endswith('.py') and '/' not in path:
+                hashes[path] = (record['sha'], record['size'])
+            return False
+        response = await core.HTTP.get(self.Tree_url + version, self.Request_headers)
+        await stream_json(response, JSON_extractor(b'tree', {b'path': 'path', b'type': 'type', b'sha': 'sha', b'size': 'size'}, add))
+        return hashes
+    def save_etag(self):
+        if self.etag is not None:
+            with open(core.VERSION_ETAG_FILE, 'w') as f:
+                f.write(self.etag)
+    def forget_etag(self):
+        # After an aborted update the next check has to fetch the branch again, not get a 304 for it
+        if core.VERSION_ETAG_FILE in os.listdir():
+            os.remove(core.VERSION_ETAG_FILE)
+    def get_local_hash(self, path):
+        # Git blob hash of the file on flash, so files a release did not touch are not downloaded
+        if path not in os.listdir():
+            return None
+        digest = hashlib.sha1(('blob ' + str(os.stat(path)[6]) + '\0').encode())
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(core.STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return binascii.hexlify(digest.digest()).decode()
+    async def get_latest_file_version(self, path, version, expected_hash, size):
+        core.log(f'  Getting latest version of {path}')
+        response = await core.HTTP.get(self.Raw_url + version + '/' + path, self.Request_headers)
+        digest = hashlib.sha1(('blob ' + str(size) + '\0').encode())
+        written = 0
+        try:
+            if response.status_code != 200:
+                core.log(f'    >> Failed getting latest version of {path}, status {response.status_code}')
+                return False
+            with open(path + '.new', 'wb') as f:
+                while True:
+                    chunk = await response.read(core.STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    written = written + len(chunk)
+        finally:
+            response.close()
+        actual_hash = binascii.hexlify(digest.digest()).decode()
+        if written != size or actual_hash != expected_hash:
+            core.log(f'    >> {path} failed verification ({written}/{size} bytes, hash {actual_hash})')
+            os.remove(path + '.new')
+            return False
+        core.log(f'    >> {path} downloaded and verified, {written} bytes')
+        return True
+    async def download(self, version):
+        # Returns the files fetched to <name>.new, or None once the update has been aborted
+        hashes = await self.get_file_hashes(version)
+        if 'main.py' not in hashes or 'core.py' not in hashes:
+            core.log('  >> main.py or core.py not found in the new version, aborting update')
+            return None
+        files = []
+        for path in hashes:
+            if self.get_local_hash(path) == hashes[path][0]:
+                core.log(f'  {path} is unchanged')
+                continue
+            if not await self.get_latest_file_version(path, version, hashes[path][0], hashes[path][1]):
+                core.log(f'  >> Failed getting latest {path} file, aborting update')
+                for downloaded in files:
+                    os.remove(downloaded + '.new')
+                return None
+            files.append(path)
+        return files
+    def write_new_version(self, files, version, previous_version):
+        core.log('    >> Marking update as pending')
+        with open(core.UPDATE_MARKER_FILE + '.new', 'w') as f:
+            f.write(json.dumps({'version': version, 'previous': previous_version, 'files': files, 'attempts': 0}))
+        if core.UPDATE_MARKER_FILE in os.listdir():
+            os.remove(core.UPDATE_MARKER_FILE)
+        os.rename(core.UPDATE_MARKER_FILE + '.new', core.UPDATE_MARKER_FILE)
+        for path in files:
+            core.log(f'  >> Swapping in new {path}')
+            backup = path + '.bak'
+            if backup in os.listdir():
+                os.remove(backup)
+            if path in os.listdir():
+                os.rename(path, backup)
+            os.rename(path + '.new', path)
+        self.write_version_file(version)
+    def write_version_file(self, version):
+        core.log('    >> Writing new version file')
+        with open(core.VERSION_TRACKER_FILE + '.new', 'w') as f:
+            f.write(version)
+        if core.VERSION_TRACKER_FILE in os.listdir():
+            os.remove(core.VERSION_TRACKER_FILE)
+        os.rename(core.VERSION_TRACKER_FILE + '.new', core.VERSION_TRACKER_FILE)
+    async def main(self):
+        current_version = self.get_version_from_disk()
+        latest_version = await self.get_version_from_github(current_version)
+        if latest_version == '':
+            core.log('  >> Failed getting newest version hash')
+            return
+        if current_version != latest_version:
+            core.log(f'  >> New version found\n  Current version: {current_version}\n  New version:     {latest_version}')
+            try:
+                files = await self.download(latest_version)
+            except Exception:
+                self.forget_etag()
+                raise
+            if files is None:
+                self.forget_etag()
+                return
+            if not files:
+                # A commit that only touched tools, the simulator or docs leaves the firmware as it is
+                core.log('  >> No firmware files changed, recording the version without resetting')
+                self.write_version_file(latest_version)
+                self.save_etag()
+                return
+            self.write_new_version(files, latest_version, current_version)
+            self.save_etag()
+            core.log('\nResetting')
+            core.HTTP.close()
+            core.METRICS.flush()
+            machine.reset()
+        else:
+            self.save_etag()
+            core.log(f'No new version found\n  Current version: {current_version}\n  Latest version:  {latest_version}')